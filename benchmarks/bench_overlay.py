@@ -0,0 +1,77 @@
+#compare the original intersect_tract_hood (called once per grade, like the notebook did)
+#with the single-pass STRtree version, on synthetic tracts/HOLC polygons
+#usage (from the repo root): python -m benchmarks.bench_overlay --scale 1 --scale 10
+import argparse
+import time
+
+import numpy as np
+import shapely
+
+from benchmarks.synthetic import HARRIS_TRACTS, HOUSTON_HOODS, make_tracts, make_hoods
+from redlining.overlay import (EQUAL_AREA_CRS, GRADES, area_fraction_matrix, intersect_tract_hood,
+                               intersect_tract_grades, dissolved_fraction_matrix)
+
+
+def time_pairwise(tracts, hoods):
+    start = time.perf_counter()
+    result = {}
+    for k in GRADES:
+        hood_grade = hoods.loc[hoods["holc_grade"] == k]
+        result[k] = intersect_tract_hood(tracts, hood_grade, k)[k].to_numpy()
+    return time.perf_counter()-start, np.column_stack([result[k] for k in GRADES])
+
+
+def time_strtree(tracts, hoods):
+    start = time.perf_counter()
+    result = intersect_tract_grades(tracts, hoods, GRADES)
+    return time.perf_counter()-start, result[GRADES].to_numpy()
+
+
+def time_dissolved(tracts, hoods):
+    start = time.perf_counter()
+    fractions, _ = dissolved_fraction_matrix(tracts, hoods, "holc_grade", GRADES)
+    return time.perf_counter()-start, fractions
+
+
+#projected once to the equal-area CRS (and optionally snapped to a grid, in meters). the synthetic
+#layers are first placed in a one-degree box around Houston so they are valid NAD83 coordinates
+def time_equal_area(tracts, hoods, grid_size=None):
+    minx, miny, maxx, maxy = tracts.total_bounds
+    span = max(maxx-minx, maxy-miny)
+    to_houston = lambda xy: (xy-[minx, miny])/span + [-95.9, 29.4]
+    tracts = tracts.set_geometry(shapely.transform(tracts.geometry.values, to_houston), crs=4269)
+    hoods = hoods.set_geometry(shapely.transform(hoods.geometry.values, to_houston), crs=4269)
+    start = time.perf_counter()
+    fractions, _ = area_fraction_matrix(tracts, hoods, "holc_grade", GRADES, crs=EQUAL_AREA_CRS, grid_size=grid_size)
+    return time.perf_counter()-start, fractions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time the tract/HOLC overlay engines")
+    parser.add_argument("--scale", type=float, action="append",
+                        help="multiple of the Harris county / Houston HOLC size (repeatable)")
+    parser.add_argument("--skip-pairwise", action="store_true",
+                        help="only time the STRtree version (the pairwise loop is very slow at large scales)")
+    args = parser.parse_args()
+
+    for scale in args.scale or [1]:
+        n_tracts = int(HARRIS_TRACTS*scale)
+        n_hoods = int(HOUSTON_HOODS*scale)
+        tracts = make_tracts(n_tracts)
+        hoods = make_hoods(n_hoods, n_tracts)
+
+        fast_time, fast = time_strtree(tracts, hoods)
+        dissolved_time, _ = time_dissolved(tracts, hoods)
+        equal_area_time, _ = time_equal_area(tracts, hoods)
+        grid_time, _ = time_equal_area(tracts, hoods, grid_size=1.0)
+        line = f"scale {scale:g}: {n_tracts} tracts x {n_hoods} hoods  strtree {fast_time:.3f}s  dissolved {dissolved_time:.3f}s" \
+               f"  equal-area {equal_area_time:.3f}s  equal-area+1m grid {grid_time:.3f}s"
+        if not args.skip_pairwise:
+            slow_time, slow = time_pairwise(tracts, hoods)
+            line += f"  pairwise {slow_time:.3f}s  speedup {slow_time/fast_time:.1f}x"
+            line += f"  max abs diff {np.abs(slow-fast).max():.2e}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
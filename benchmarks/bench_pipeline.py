@@ -0,0 +1,122 @@
+#time every stage of the redlining pipeline on synthetic data at several multiples of the
+#Harris county / Houston HOLC size, and write wall time and peak RSS per stage to a json report
+#usage (from the repo root): python -m benchmarks.bench_pipeline --scale 1 --scale 10 --out bench.json
+#each scale runs in its own process so its peak RSS is not inflated by the previous one
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+
+from benchmarks.synthetic import write_city
+from redlining.census import read_b02001, race_shares_wide, add_race_change, race_changes
+from redlining.deeds import read_deeds, join_deeds
+from redlining.overlay import GRADES, area_fraction_matrix
+from redlining.render import render_figures, report_figures
+from redlining.tracts import load_tracts
+
+STAGES = ["load","prep","overlay","change","deed_join","render"]
+
+
+#peak resident set size of this process so far, in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on macOS, KB on Linux
+    return peak/1024**2 if sys.platform == "darwin" else peak/1024
+
+
+def run_scale(scale, stages, overlay_workers, data_dir):
+    city = write_city(os.path.join(data_dir, f"scale_{scale:g}"), scale)
+    report = {"scale": scale, "stages": {}}
+    state = {}
+
+    def stage(name, func):
+        if name not in stages:
+            return
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        rows = func()
+        report["stages"][name] = {"wall_s": round(time.perf_counter()-start_wall, 4),
+                                  "cpu_s": round(time.process_time()-start_cpu, 4),
+                                  "peak_rss_mb": round(peak_rss_mb(), 1),
+                                  "rows": rows}
+
+    def load():
+        state["race_long"] = read_b02001(city["acs"])
+        state["tracts"] = load_tracts(city["tracts"], geo_ids=state["race_long"]["id"].cat.categories)
+        state["hoods"] = gpd.read_file(city["holc"])
+        state["deeds"] = read_deeds(city["deeds"], city["tract_prefix"])
+        return len(state["tracts"])
+
+    def prep():
+        race_merged = race_shares_wide(state["race_long"])
+        state["table"] = state["tracts"].merge(race_merged, how="left", left_on="GEO_ID", right_on="id")
+        return len(state["table"])
+
+    def overlay():
+        fractions, grades = area_fraction_matrix(state["table"], state["hoods"], "holc_grade", GRADES,
+                                                 workers=overlay_workers)
+        state["table"][grades] = fractions.round(4)
+        state["table"]["U"] = 1-state["table"][grades].sum(axis=1)
+        return int((state["table"]["U"] < 1).sum())
+
+    def change():
+        add_race_change(state["table"], 2010, 2018)
+        return len(race_changes(state["race_long"]))
+
+    def deed_join():
+        state["table"] = join_deeds(state["table"], state["deeds"])
+        return len(state["table"])
+
+    def render():
+        out_dir = os.path.join(data_dir, f"figures_{scale:g}")
+        return len(render_figures(state["table"], report_figures(state["table"]), out_dir))
+
+    #later stages need the earlier ones, so every stage up to the last requested one runs
+    last = max(STAGES.index(s) for s in stages)
+    for name, func in zip(STAGES[:last+1], [load, prep, overlay, change, deed_join, render]):
+        if name in stages:
+            stage(name, func)
+        else:
+            func()
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the redlining pipeline on synthetic data")
+    parser.add_argument("--scale", type=float, action="append",
+                        help="multiple of the Harris county / Houston HOLC size (repeatable, default 1 10 100)")
+    parser.add_argument("--stage", action="append", choices=STAGES, help="stages to time (default: all)")
+    parser.add_argument("--overlay-workers", type=int, default=1)
+    parser.add_argument("--data-dir", default=None, help="where to write the synthetic data (default: a temp dir)")
+    parser.add_argument("--out", default="bench_pipeline.json", help="json report (default: bench_pipeline.json)")
+    args = parser.parse_args()
+
+    scales = args.scale or [1, 10, 100]
+    stages = args.stage or STAGES
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="redlining_bench_")
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for scale in scales:
+        with ctx.Pool(1) as pool:
+            result = pool.apply(run_scale, (scale, stages, args.overlay_workers, data_dir))
+        results.append(result)
+        print(f"scale {scale:g}: " + "  ".join(f"{name} {s['wall_s']:.2f}s" for name, s in result["stages"].items())
+              + f"  peak {result['peak_rss_mb']:.0f} MB")
+
+    with open(args.out, "w") as f:
+        json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                   "cpus": os.cpu_count(), "results": results}, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#startup cost of each stage of the pipeline: for every module, a fresh interpreter imports it
+#with -X importtime, and we report the total import time and which heavy dependencies it pulled in
+#usage (from the repo root): python -m benchmarks.import_profile [--out import_profile.json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+#stage -> module it needs
+STAGES = {
+    "package": "redlining",
+    "census": "redlining.census",
+    "deeds": "redlining.deeds",
+    "pipeline": "redlining.pipeline",
+    "batch": "redlining.batch",
+    "store": "redlining.store",
+    "export": "redlining.export",
+    "density": "redlining.density",
+    "tracts": "redlining.tracts",
+    "overlay": "redlining.overlay",
+    "cache": "redlining.cache",
+    "blocks": "redlining.blocks",
+    "render": "redlining.render",
+    "query": "redlining.query",
+    "stats": "redlining.stats",
+}
+HEAVY = ["numpy","pandas","pyarrow","shapely","pyogrio","pyproj","geopandas","matplotlib","scipy"]
+
+
+#(total import time in ms, heavy modules loaded) for importing module in a fresh interpreter
+def profile_import(module, repeat=3):
+    check = f"import {module}, sys, json; print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))"
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", check], capture_output=True,
+                              text=True, check=True, cwd=os.getcwd())
+        total = 0
+        for line in proc.stderr.splitlines():
+            #import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            #top-level imports are the ones without indentation
+            if not name.startswith("  "):
+                total += int(cumulative)
+        best = total if best is None else min(best, total)
+        loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return best/1000, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import-time profile of the redlining stages")
+    parser.add_argument("--out", default=None, help="also write the profile as json")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs (default: 3)")
+    args = parser.parse_args()
+
+    report = {}
+    for stage, module in STAGES.items():
+        ms, loaded = profile_import(module, args.repeat)
+        report[stage] = {"module": module, "import_ms": round(ms, 1), "loads": loaded}
+        print(f"{stage:10s} {module:22s} {ms:8.1f} ms  {' '.join(loaded) or '-'}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
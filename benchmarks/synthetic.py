@@ -0,0 +1,99 @@
+#synthetic stand-ins for the census tracts and the HOLC polygons, used by the benchmarks
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+#Harris county has ~790 tracts in the race tables, the Houston HOLC map has ~130 polygons
+HARRIS_TRACTS = 790
+HOUSTON_HOODS = 130
+
+
+#square grid of tracts with census-style ids, roughly n_tracts cells
+def make_tracts(n_tracts=HARRIS_TRACTS, seed=0):
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_tracts)))
+    x, y = np.meshgrid(np.arange(side, dtype=float), np.arange(side, dtype=float))
+    x = x.ravel()[:n_tracts]
+    y = y.ravel()[:n_tracts]
+    #jitter the cell size a little so tracts are not all the same area
+    size = 1 + rng.uniform(-0.2, 0.2, n_tracts)
+    geoms = shapely.box(x, y, x+size, y+size)
+    ids = ["1400000US48201" + str(100000+i) for i in range(n_tracts)]
+    return gpd.GeoDataFrame({"id": ids, "GEO_ID": ids}, geometry=geoms)
+
+
+#random irregular HOLC-style polygons over the same extent as make_tracts(n_tracts)
+def make_hoods(n_hoods=HOUSTON_HOODS, n_tracts=HARRIS_TRACTS, seed=1):
+    rng = np.random.default_rng(seed)
+    side = np.ceil(np.sqrt(n_tracts))
+    centers = rng.uniform(0, side, (n_hoods, 2))
+    radius = rng.uniform(0.5, 2.5, n_hoods)
+    geoms = shapely.buffer(shapely.points(centers), radius, quad_segs=4)
+    grades = rng.choice(["A","B","C","D"], n_hoods)
+    return gpd.GeoDataFrame({"holc_grade": grades}, geometry=geoms)
+
+
+#the two header rows of a B02001 download: machine names, then long labels
+ACS_COLUMNS = ["GEO_ID","NAME"] + [f"B02001_{i:03d}{kind}" for i in range(1, 11) for kind in "EM"]
+ACS_LABELS = ["id","Geographic Area Name"] + [f"{kind}!!Total{label}" for label in [
+    "", "!!White alone", "!!Black or African American alone", "!!American Indian and Alaska Native alone",
+    "!!Asian alone", "!!Native Hawaiian and Other Pacific Islander alone", "!!Some other race alone",
+    "!!Two or more races", "!!Two or more races!!Two races including Some other race",
+    "!!Two or more races!!Two races excluding Some other race, and three or more races"]
+    for kind in ["Estimate","Margin of Error"]]
+
+
+#synthetic ACS B02001 table for the tracts, in the layout of the census download
+def write_acs(tracts, year, path, seed=2):
+    rng = np.random.default_rng(seed+year)
+    n = len(tracts)
+    #white, black, native, asian, pacific, other, two including other, two excluding other
+    parts = rng.integers(0, 2000, (n, 8))
+    two_or_more = parts[:,6]+parts[:,7]
+    estimates = np.column_stack([parts.sum(axis=1), parts[:,:6], two_or_more, parts[:,6:]])
+    table = pd.DataFrame({"GEO_ID": tracts["GEO_ID"].to_numpy(),
+                          "NAME": [f"Census Tract {i}, Synthetic County, Texas" for i in range(n)]})
+    for i in range(10):
+        table[f"B02001_{i+1:03d}E"] = estimates[:,i]
+        table[f"B02001_{i+1:03d}M"] = rng.integers(0, 500, n)
+    with open(path, "w") as f:
+        f.write(",".join(f'"{c}"' for c in ACS_COLUMNS) + "\n")
+        f.write(",".join(f'"{c}"' for c in ACS_LABELS) + "\n")
+        table.to_csv(f, header=False, index=False)
+    return path
+
+
+#synthetic deed restriction table covering a few percent of the tracts
+def make_deeds(tracts, seed=3):
+    rng = np.random.default_rng(seed)
+    n = max(len(tracts)//40, 1)
+    rows = rng.choice(len(tracts), n, replace=False)
+    return pd.DataFrame({"tract_2010": [tracts["GEO_ID"].iloc[i][-6:] for i in rows],
+                         "Neighborhood": [f"Neighborhood {i//3}" for i in range(n)],
+                         "restriction": rng.choice(["current","removed","never"], n),
+                         "degree": rng.choice(["some","half","most"], n)})
+
+
+#write a full synthetic city (tract shapefile, HOLC shapefile, 2010/2018 ACS tables, deed table) at
+#scale x the size of Harris county / the Houston HOLC map, as a redlining.batch manifest entry
+def write_city(out_dir, scale=1, name="synthetic"):
+    os.makedirs(out_dir, exist_ok=True)
+    n_tracts = int(HARRIS_TRACTS*scale)
+    tracts = make_tracts(n_tracts).drop(columns="id").set_crs(4269)
+    #a few extra tracts from "another county", like the statewide shapefile
+    extra = make_tracts(n_tracts//10 + 1, seed=5).drop(columns="id").set_crs(4269)
+    extra["GEO_ID"] = "1400000US48999" + extra["GEO_ID"].str[-6:]
+    city = {"city": name,
+            "tracts": os.path.join(out_dir, "tracts.shp"),
+            "holc": os.path.join(out_dir, "holc.shp"),
+            "acs": [write_acs(tracts, year, os.path.join(out_dir, f"ACSDT5Y{year}.B02001_synthetic.csv"))
+                    for year in (2010, 2018)],
+            "deeds": os.path.join(out_dir, "deed_restrictions.csv"),
+            "tract_prefix": "1400000US48201"}
+    pd.concat([tracts, extra], ignore_index=True).to_file(city["tracts"])
+    make_hoods(int(HOUSTON_HOODS*scale), n_tracts).set_crs(4269).to_file(city["holc"])
+    make_deeds(tracts).to_csv(city["deeds"], index=False)
+    return city
@@ -13,18 +13,10 @@
 # In[169]:
 
 #import libraries
-import numpy as np
-import pandas as pd
-import scipy
-import os
-from matplotlib import cm
+#(the tract/redlining helpers are imported from the redlining package in the cells that use them)
 import matplotlib.pyplot as plt
-import geopandas as gpd
-import earthpy as et
-from matplotlib.colors import ListedColormap, LinearSegmentedColormap
+from matplotlib.colors import ListedColormap
 import matplotlib.colors as clr
-from shapely.geometry import Polygon
-from shapely.geometry import shape
 
 
 # #  
@@ -34,87 +26,40 @@ from shapely.geometry import shape
 
 # In[2]:
 
+##input data
+#the input files are listed in data/houston.json (the same format as the multi-city runs) and are
+#all read at once in parallel: race data, census tracts, redlining map and deed restrictions
+from redlining.batch import read_manifest
+from redlining.census import race_shares_wide
+from redlining.sources import read_city_inputs
+
+houston = read_manifest("data/houston.json")[0]
+inputs = read_city_inputs(houston)
+
 ##race data
 #these are "estimated" counts of people by race from the census for 2010 and 2018
-#read as pandas dataframes
-race_2010_raw = pd.read_csv("/Users/aschalck/Desktop/final_project/racedata/ACSDT5Y2010.B02001_data_with_overlays_2020-08-07T121140.csv", skiprows=1)
-race_2018_raw = pd.read_csv("/Users/aschalck/Desktop/final_project/racedata/ACSDT5Y2018.B02001_data_with_overlays_2020-08-07T121140.csv", skiprows=1)
+#both years are in one long-format table (tract, year, race group)
+race_long = inputs["race_long"]
 
 
 # In[3]:
 
 #the raw data has lots of columns I'm not interested in, and very long column names
-race_2010_raw.head()
+#only the total, white alone, black alone and two or more races estimates are read
+race_long.head()
 
 
 # #  
 # ## Preparing the census data
 # 
-# To prepare the data for further analysis, and merging with other data tables, I gave the columns simpler names, and filtered unwanted columns. Also, I converted people counts into percentages for each tract. I combined non-black and non-white single-race peoples (i.e. Asian, Native American, Pacific Islander) into a category I called "other" because many of their counts were small anyways. I categorized all people listed as "two or more races" as "mixed". The processed tables are dislayed below. If this project included three or more years, I would have made this into a function and probably made the data long-format instead of the current wide-format. 
+# To prepare the data for further analysis, and merging with other data tables, I gave the columns simpler names, and filtered unwanted columns. Also, I converted people counts into percentages for each tract. I combined non-black and non-white single-race peoples (i.e. Asian, Native American, Pacific Islander) into a category I called "other" because many of their counts were small anyways. I categorized all people listed as "two or more races" as "mixed". The processed tables are dislayed below. The preparation is a function (`read_b02001` in redlining/census.py) that takes any number of years and produces long-format data; the wide-format table is only built for merging with the shape data. 
 
 # In[4]:
 
-#prepare the 2010 race data to merge
-
-#rename the important columns
-race_2010 = race_2010_raw.rename(columns={'Estimate!!Total':'total_2010',
-                                          'Estimate!!Total!!White alone':'white_alone_2010',
-                                          'Estimate!!Total!!Black or African American alone':'black_alone_2010',
-                                          'Estimate!!Total!!Two or more races':'mixed_race_2010'})
-
-#select the important columns
-race_2010 = race_2010[['id','total_2010','white_alone_2010','black_alone_2010','mixed_race_2010']]
-
-#calculate percentages
-race_2010['percent_white_2010'] = race_2010['white_alone_2010']/race_2010['total_2010']
-race_2010['percent_black_2010'] = race_2010['black_alone_2010']/race_2010['total_2010']
-race_2010['percent_mixed_2010'] = race_2010['mixed_race_2010']/race_2010['total_2010']
-race_2010['percent_other_2010'] = 1-(race_2010['percent_white_2010']+race_2010['percent_black_2010']+race_2010['percent_mixed_2010'])
-
-#select the columns for merging
-race_2010 = race_2010.iloc[:,[0,1,5,6,7,8]]
-
-race_2010.head()
-
-
-# In[5]:
-
-#the raw data has lots of columns I'm not interested in, and very long column names
-#the structure is the same as the 2010 data
-race_2018_raw.head()
-
-
-# In[6]:
-
-#if I had three or more years I would make this into a function
-#prepare the 2018 race data to merge
-
-#rename the important columns
-race_2018 = race_2018_raw.rename(columns={'Estimate!!Total':'total_2018',
-                                          'Estimate!!Total!!White alone':'white_alone_2018',
-                                          'Estimate!!Total!!Black or African American alone':'black_alone_2018',
-                                          'Estimate!!Total!!Two or more races':'mixed_race_2018'})
-
-#select the important columns
-race_2018 = race_2018[['id','total_2018','white_alone_2018','black_alone_2018','mixed_race_2018']]
-
-#calculate percentages
-race_2018['percent_white_2018'] = race_2018['white_alone_2018']/race_2018['total_2018']
-race_2018['percent_black_2018'] = race_2018['black_alone_2018']/race_2018['total_2018']
-race_2018['percent_mixed_2018'] = race_2018['mixed_race_2018']/race_2018['total_2018']
-race_2018['percent_other_2018'] = 1-(race_2018['percent_white_2018']+race_2018['percent_black_2018']+race_2018['percent_mixed_2018'])
-
-#select the columns for merging
-race_2018 = race_2018.iloc[:,[0,1,5,6,7,8]]
-
-race_2018.head()
-
-
-# In[7]:
-
-#the census tract id's are identical and all are present in both dataframes
-#merge by censis tract ID
-race_merged = race_2010.merge(race_2018,how="inner",on="id")
+#the percentages are already calculated for every year in race_long
+#the census tract id's are identical and all are present in both years
+#wide version (one row per tract) for merging with the shape data
+race_merged = race_shares_wide(race_long)
 race_merged.head()
 
 
@@ -127,20 +72,10 @@ race_merged.head()
 
 ##census tracts shapefile for 2010
 #tract data shapefiles can only be downloaded for the whole state (All of Texas)
-census_tracts_2010 = gpd.read_file('/Users/aschalck/Desktop/final_project/2010_tracts/gz_2010_48_140_00_500k.shp')
-census_tracts_2010.head()
-
-
-# In[9]:
-
-#the raw data is all of texas
-census_tracts_2010.plot()
-
-
-# In[10]:
-
-#filter the spatial data so that it only includes the tracts also present in the 2010 race data (i.e. Harris county)
-census_tracts_2010_harris = census_tracts_2010.loc[census_tracts_2010["GEO_ID"].isin(race_2010["id"])]
+#instead of reading all of texas and filtering afterwards, the shapefile is streamed and only the
+#tracts also present in the race data (i.e. Harris county) are kept. The subset is saved as
+#GeoParquet ("tracts_cache" in data/houston.json) so later runs skip the shapefile entirely.
+census_tracts_2010_harris = inputs["tracts"]
 census_tracts_2010_harris.head()
 
 
@@ -231,7 +166,7 @@ tracts_race_merged.plot(ax=axes[1,1],column='percent_mixed_2018',
 # In[15]:
 
 #historial redlining tracts
-redlining_1938 = gpd.read_file('/Users/aschalck/Desktop/final_project/redlining/cartodb-query.shp')
+redlining_1938 = inputs["hoods"]
 
 
 # In[16]:
@@ -270,47 +205,36 @@ redlining_1938.plot(ax = harris_tracts_plot_2010,
 # In[19]:
 
 #function that quantifies the percent of a modern tract that is in a neighborhood from the redlining data
-def intersect_tract_hood(tracts_df, hoods_df, colname):
-
-    geom_tract = [shape(feat["geometry"]) for k, feat in tracts_df.iterrows()]
-    geom_hood = [shape(feat["geometry"]) for k, feat in hoods_df.iterrows()]
-
-    out_df = pd.DataFrame(tracts_df["id"])
-    out_df[colname] = 0
-    
-    for i, tract in enumerate(geom_tract):
-        for j, hood in enumerate(geom_hood):
-            if tract.intersects(hood):
-                out_df.loc[i,colname] += tract.intersection(hood).area/tract.area
-   
-    return(out_df)
+#the original pairwise version (intersect_tract_hood) now lives in redlining/overlay.py next to the
+#spatial-index version (area_fraction_matrix), which gives a (tract x grade) array for all grades in
+#one pass. the overlay result is cached on disk (keyed by the input geometries), so re-runs skip it
+from redlining.cache import cached_area_fraction_matrix
 
 
 # In[20]:
 
 #calculate the percentage for each tract, for each  redlining grade
-tracts_race_redline = tracts_race_merged
-
 grades = ["A","B","C","D"]
 
-for k in grades:
-    hood_grade = redlining_1938.loc[redlining_1938["holc_grade"] == k]
-    hood_intersect = intersect_tract_hood(tracts_race_merged, hood_grade, k)
-    hood_intersect[k] = hood_intersect[k].round(4)
-    tracts_race_redline = tracts_race_redline.merge(hood_intersect, how="left", on="id") 
+#rows of the fraction array are in the same order as tracts_race_merged, so no merge is needed
+grade_fractions, grades = cached_area_fraction_matrix(tracts_race_merged, redlining_1938, "holc_grade", grades)
+grade_fractions = grade_fractions.round(4)
+
+tracts_race_redline = tracts_race_merged.copy()
+tracts_race_redline[grades] = grade_fractions
 
 #'U' is for "unassigned" to a redlining tract
-tracts_race_redline["U"] = 1-tracts_race_redline[grades].sum(axis=1)
+tracts_race_redline["U"] = 1-grade_fractions.sum(axis=1)
 tracts_race_redline.head()
 
 
 # In[21]:
 
 #calculate the percentage change of each race for each tract from 2010 to 2018
-tracts_race_redline["white_only_change"] = round(tracts_race_redline["percent_white_2018"] - tracts_race_redline["percent_white_2010"],2)
-tracts_race_redline["black_only_change"] = round(tracts_race_redline["percent_black_2018"] - tracts_race_redline["percent_black_2010"],2)
-tracts_race_redline["other_only_change"] = round(tracts_race_redline["percent_other_2018"] - tracts_race_redline["percent_other_2010"],2)
-tracts_race_redline["mixed_change"] = round(tracts_race_redline["percent_mixed_2018"] - tracts_race_redline["percent_mixed_2010"],2)
+#adds white_only_change, black_only_change, other_only_change and mixed_change (rounded to 2 places)
+from redlining.census import add_race_change
+
+tracts_race_redline = add_race_change(tracts_race_redline, 2010, 2018)
 tracts_race_redline.head()
 
 
@@ -395,13 +319,19 @@ plt.show()
 
 # In[26]:
 
+from redlining.render import draw_grade_boxes
+from redlining.stats import box_stats, top_grade
+
 #identify the most historical grade that makes up the largest percentage of the census tract
 #called "top_grade"
-tracts_race_redline_filter["top_grade"] = tracts_race_redline_filter.loc[:,["A","B","C","D"]].idxmax(axis="columns")
+tracts_race_redline_filter["top_grade"] = top_grade(tracts_race_redline_filter)
 
-#plot race percentage by the predominant tract grade
-tracts_race_redline_filter.boxplot(column = ["percent_white_2010","percent_black_2010","percent_other_2010","percent_mixed_2010"],
-                                   by="top_grade",figsize=(15,15), color = "grey")
+#plot race percentage by the predominant tract grade (the box summaries are computed once for every column)
+grade_boxes = box_stats(tracts_race_redline_filter)
+fig, axes = plt.subplots(2, 2, figsize=(15,15))
+for ax, column in zip(axes.flatten(), ["percent_white_2010","percent_black_2010","percent_other_2010","percent_mixed_2010"]):
+    draw_grade_boxes(ax, grade_boxes, column)
+plt.show()
 
 
 # # 
@@ -432,6 +362,17 @@ fig.legend(handles, labels, loc="upper right")
 plt.show()
 
 
+# #  
+# The same comparison as averages: the mean change of each group among the tracts of each grade, weighted by the tracts' 2010 population (so it is the change among the grade's residents), with 95% bootstrap intervals.
+
+# In[195]:
+
+from redlining.stats import grade_aggregates
+
+grade_stats = grade_aggregates(tracts_race_redline, columns=groups, n_boot=1000)
+grade_stats.loc[(grade_stats["grouping"] == "top_grade") & (grade_stats["weighting"] == "population")]
+
+
 # #  
 # ## Deed restrictions
 # 
@@ -449,29 +390,21 @@ plt.show()
 
 # In[28]:
 
-deeds_raw = pd.read_csv("/Users/aschalck/Desktop/final_project/deed_restrictions.csv")
+#read_deeds also processes the tract name so that it can be merged
+from redlining.deeds import join_deeds
+
+deeds_raw = inputs["deeds"]
 deeds_raw.head()
 
 
 # In[29]:
 
-#process the tract name so that it can be merged
-deeds_raw["id"] = "1400000US48201" + deeds_raw["tract_2010"].astype(str)
-
 #merge to the census tract and race data table
-tracts_race_deeds_merged = tracts_race_redline.merge(deeds_raw, how="left", on="id")
+#and replace the NAN's with "unknown"
+tracts_race_deeds_merged = join_deeds(tracts_race_redline, deeds_raw)
 tracts_race_deeds_merged.head()
 
 
-# In[161]:
-
-#replace the NAN's with "unknown"
-tracts_race_deeds_merged['Neighborhood'] = tracts_race_deeds_merged['Neighborhood'].fillna("unknown")
-tracts_race_deeds_merged['restriction'] = tracts_race_deeds_merged['restriction'].fillna("unknown")
-tracts_race_deeds_merged['degree'] = tracts_race_deeds_merged['degree'].fillna("unknown")
-#tracts_race_deeds_merged.head()
-
-
 # #  
 # Like the redlining data, most of the studied neighborhoods are within the 610 loop.
 
@@ -497,12 +430,17 @@ tracts_race_deeds_merged.groupby("restriction")[["white_only_change","black_only
 
 # In[184]:
 
+#all the group x restriction curves are evaluated at once on one shared grid (and cached),
+#so only the drawing happens here
+from redlining.density import cached_density_curves
+from redlining.render import draw_density
+
+restriction_kde = cached_density_curves(tracts_race_deeds_merged, groups, "restriction", bw_method=0.5)
+
 fig, ax = plt.subplots(2,2,figsize=(15,10))
 ax = ax.flatten()
-[a.set_prop_cycle('color',["red",'steelblue','gold','darkgrey']) for a in ax]
 for i, group in enumerate(groups):
-    for idx, gp in tracts_race_deeds_merged.groupby("restriction"):
-        gp[group].plot(kind='kde', bw_method=0.5, legend=True, xlim = [-0.4,0.4], label=idx, ax=ax[i], title=group)
+    draw_density(ax[i], restriction_kde, group, xlim=[-0.4,0.4])
 
 
 # #
@@ -512,7 +450,16 @@ for i, group in enumerate(groups):
 
 # In[191]:
 
-oak_forest = tracts_race_deeds_merged.loc[tracts_race_deeds_merged["Neighborhood"].isin(["Oak Forest East", "Oak Forest West"])].copy()
+#the tract table is kept in a compact store (one copy of the geometry, typed columns) behind a
+#query object with a spatial index and a neighborhood index; only the selected rows are turned back
+#into a geodataframe. tract_query.polygon(...) and tract_query.point(x, y) work the same way for
+#areas that are not a named neighborhood
+from redlining.query import TractQuery
+from redlining.store import TractStore
+
+tract_query = TractQuery(TractStore.from_frame(tracts_race_deeds_merged))
+oak_forest = tract_query.neighborhood(["Oak Forest East", "Oak Forest West"],
+                                      ["id","Neighborhood","degree","restriction","percent_black_2010"], geometry=True)
 
 
 # ### Plot notes
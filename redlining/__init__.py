@@ -0,0 +1,34 @@
+#helper functions for the Houston redlining analysis (final_project.py)
+#the submodules are only imported when one of their names is first used, so e.g. the census and
+#deed steps never load shapely/GEOS, geopandas or matplotlib
+import importlib
+
+EXPORTS = {
+    "redlining.constants": ["GRADES", "EQUAL_AREA_CRS"],
+    "redlining.overlay": ["intersect_tract_hood", "intersect_tract_grades", "area_fraction_matrix",
+                          "dissolve_by_category", "dissolved_fraction_matrix"],
+    "redlining.cache": ["cached_area_fraction_matrix", "cached_dissolve"],
+    "redlining.census": ["RACE_GROUPS", "read_b02001", "race_shares_wide", "share_array", "race_changes",
+                         "add_race_change"],
+    "redlining.deeds": ["read_deeds", "join_deeds"],
+    "redlining.tracts": ["read_tracts", "load_tracts"],
+    "redlining.store": ["TractStore"],
+    "redlining.export": ["write_results", "open_results"],
+    "redlining.density": ["density_curves", "cached_density_curves"],
+    "redlining.query": ["TractQuery"],
+    "redlining.stats": ["grade_aggregates", "box_stats"],
+}
+LOCATIONS = {name: module for module, names in EXPORTS.items() for name in names}
+__all__ = list(LOCATIONS)
+
+
+def __getattr__(name):
+    if name not in LOCATIONS:
+        raise AttributeError(f"module 'redlining' has no attribute {name!r}")
+    value = getattr(importlib.import_module(LOCATIONS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
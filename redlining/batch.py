@@ -0,0 +1,183 @@
+#headless runner for the redlining analysis over many HOLC cities
+#every city goes through ingestion -> overlay -> race change -> deed join in its own worker process,
+#and its tract table is written to <out_dir>/<city>.parquet (or .feather)
+#
+#usage: python -m redlining.batch cities.json --out results/ --workers 32
+#
+#cities.json is a list of cities, e.g.
+#  [{"city": "houston",
+#    "holc": "data/cartodb-query.shp",
+#    "tracts": "tracts/gz_2010_48_140_00_500k.shp",
+#    "acs": ["data/ACSDT5Y2010.B02001_....csv", "data/ACSDT5Y2018.B02001_....csv"],
+#    "deeds": "data/deed_restrictions.csv",
+#    "tract_prefix": "1400000US48201"}]
+#"deeds" and "tract_prefix" are optional; relative paths are relative to the json file. Any input can
+#also be an object-store URI, store://<bucket>/<key> (see redlining/sources.py), and an optional
+#"tracts_cache" path keeps the city's tracts as GeoParquet between runs
+#with an optional "blocks" (census block population shapefile, see redlining/blocks.py) the grade
+#fractions are population-weighted from the blocks instead of area-weighted
+#next to every table, <city>.grade_stats.csv and <city>.grade_boxes.csv hold the statistics by grade
+#and top grade (see redlining/stats.py) that the reports and figures read
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from redlining import instrument
+from redlining.constants import EQUAL_AREA_CRS
+from redlining.pipeline import merge_race, redline_overlay, redline_blocks, race_change, deed_join
+from redlining.sources import WORKERS, fetch_cities, is_remote, read_city_inputs
+from redlining.stats import box_stats, grade_aggregates, write_stats
+
+
+#the notebook pipeline for one city, returns the tract table. the input files are read
+#concurrently by io_workers threads (see redlining/sources.py), and the overlay runs on
+#overlay_workers processes
+def city_table(city, cache_dir=None, dissolve=False, io_workers=WORKERS, area_crs=None, grid_size=None,
+               overlay_workers=1):
+
+    with instrument.stage("read"):
+        inputs = read_city_inputs(city, io_workers)
+        instrument.add(**{f"{name}_rows": len(table) for name, table in inputs.items() if table is not None})
+    with instrument.stage("tracts"):
+        tracts = merge_race(inputs["tracts"], inputs["race_long"])
+        instrument.add(rows=len(tracts))
+    with instrument.stage("redline"):
+        if city.get("blocks"):
+            tracts = redline_blocks(tracts, inputs["hoods"], city["blocks"])
+        else:
+            tracts = redline_overlay(tracts, inputs["hoods"], cache_dir, overlay_workers, dissolve=dissolve,
+                                     area_crs=area_crs, grid_size=grid_size)
+    with instrument.stage("change"):
+        tracts = race_change(tracts, inputs["race_long"])
+    if inputs["deeds"] is not None:
+        with instrument.stage("deeds"):
+            tracts = deed_join(tracts, inputs["deeds"])
+            instrument.add(rows=len(tracts))
+
+    tracts.insert(0, "city", city["city"])
+    return tracts
+
+
+#worker entry point: run one city and write its table, returns (city, path, seconds).
+#fmt "parquet" writes GeoParquet, "feather" a memory-mappable Arrow file (see redlining/export.py).
+#with profile=True the city's stage profile is written next to it (<city>.profile.json and
+#<city>.trace.json, see redlining/instrument.py), with the peak traced memory of every stage if
+#trace_memory is also set (slower, see instrument.enable). n_boot bootstrap replicates give the grade
+#statistics confidence intervals (run in the city's own process, the cities already use every core)
+def run_city(city, out_dir, cache_dir=None, dissolve=False, fmt="parquet", profile=False, io_workers=WORKERS,
+             area_crs=None, grid_size=None, n_boot=0, trace_memory=False, overlay_workers=1):
+    start = time.perf_counter()
+    if profile:
+        instrument.enable(trace_memory)
+        instrument.reset()
+    with instrument.stage(city["city"]):
+        table = city_table(city, cache_dir, dissolve, io_workers, area_crs, grid_size, overlay_workers)
+        path = os.path.join(out_dir, f"{city['city']}.{fmt}")
+        with instrument.stage("write"):
+            if fmt == "feather":
+                from redlining.export import write_results
+                write_results(table, path)
+            else:
+                table.to_parquet(path, index=False)
+        with instrument.stage("stats"):
+            #one row per tract (the deed join repeats tracts shared by deed neighborhoods)
+            tracts = table.drop_duplicates("id")
+            write_stats(grade_aggregates(tracts, n_boot=n_boot), os.path.join(out_dir, f"{city['city']}.grade_stats.csv"))
+            write_stats(box_stats(tracts), os.path.join(out_dir, f"{city['city']}.grade_boxes.csv"))
+    if profile:
+        instrument.write_json(os.path.join(out_dir, f"{city['city']}.profile.json"))
+        instrument.write_trace(os.path.join(out_dir, f"{city['city']}.trace.json"))
+    return city["city"], path, time.perf_counter()-start
+
+
+def read_manifest(path):
+    with open(path) as f:
+        cities = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        return p if os.path.isabs(p) or is_remote(p) else os.path.join(base, p)
+
+    for city in cities:
+        for key in ("holc","tracts","deeds","blocks","tracts_cache"):
+            if city.get(key):
+                city[key] = resolve(city[key])
+        city["acs"] = [resolve(p) for p in city["acs"]]
+    return cities
+
+
+#run every city in a process pool; a failing city is reported and does not stop the others.
+#object-store inputs of all the cities are fetched up front, concurrently, before any city starts.
+#every city process runs its overlay on overlay_workers processes of its own, so by default
+#workers is the number of cores divided by overlay_workers (workers x overlay_workers in total)
+def run_batch(cities, out_dir, workers=None, cache_dir=None, dissolve=False, fmt="parquet", profile=False,
+              io_workers=WORKERS, store_root=None, fetch_dir=None, area_crs=None, grid_size=None, n_boot=0,
+              trace_memory=False, overlay_workers=1):
+    os.makedirs(out_dir, exist_ok=True)
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1)//overlay_workers)
+    cities = fetch_cities(cities, store_root, fetch_dir, io_workers)
+    results = {}
+    failed = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_city, city, out_dir, cache_dir, dissolve, fmt, profile, io_workers,
+                               area_crs, grid_size, n_boot, trace_memory, overlay_workers): city["city"] for city in cities}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                _, path, seconds = future.result()
+            except Exception:
+                failed[name] = traceback.format_exc()
+                print(f"{name}: FAILED", file=sys.stderr)
+                print(failed[name], file=sys.stderr)
+            else:
+                results[name] = path
+                print(f"{name}: {path} ({seconds:.1f}s)")
+    return results, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run the redlining analysis for many HOLC cities")
+    parser.add_argument("manifest", help="json list of cities (see the top of redlining/batch.py)")
+    parser.add_argument("--out", default="results", help="output directory (default: results)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="cities run at once, in worker processes (default: all cores / --overlay-workers)")
+    parser.add_argument("--overlay-workers", type=int, default=1,
+                        help="processes for each city's tract/HOLC overlay, for a few large cities "
+                             "(default: 1, not used with --dissolve)")
+    parser.add_argument("--cache-dir", default=None, help="cache the overlay results in this directory")
+    parser.add_argument("--dissolve", action="store_true", help="overlay against the HOLC layer dissolved by grade")
+    parser.add_argument("--equal-area", action="store_true", help="measure overlay areas in an equal-area CRS (EPSG:5070)")
+    parser.add_argument("--grid-size", type=float, default=None, metavar="METERS",
+                        help="snap the overlay to a precision grid of this size in meters (implies --equal-area)")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                        help="bootstrap replicates for confidence intervals on the grade statistics (default: none)")
+    parser.add_argument("--format", choices=["parquet","feather"], default="parquet",
+                        help="GeoParquet, or memory-mappable Arrow for redlining.export.open_results (default: parquet)")
+    parser.add_argument("--profile", action="store_true",
+                        help="write each city's per-stage timings, peak RSS and counts (<city>.profile.json, "
+                             "<city>.trace.json) to the output directory")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="with --profile, also record each stage's peak Python/NumPy memory with tracemalloc "
+                             "(slows the pandas stages down several times)")
+    parser.add_argument("--io-workers", type=int, default=WORKERS,
+                        help=f"threads reading each city's input files (default: {WORKERS})")
+    parser.add_argument("--store", default=None, help="object store root for store:// inputs (default: $REDLINING_STORE)")
+    parser.add_argument("--fetch-dir", default=None, help="local copies of store:// inputs (default: $REDLINING_FETCH_DIR)")
+    args = parser.parse_args(argv)
+
+    cities = read_manifest(args.manifest)
+    #the grid is in meters, so it is always used in the equal-area CRS
+    area_crs = EQUAL_AREA_CRS if args.equal_area or args.grid_size is not None else None
+    _, failed = run_batch(cities, args.out, args.workers, args.cache_dir, args.dissolve, args.format, args.profile,
+                          args.io_workers, args.store, args.fetch_dir, area_crs, args.grid_size, args.bootstrap,
+                          args.trace_memory, args.overlay_workers)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#block-level (dasymetric) version of the tract/HOLC overlay
+#instead of weighting each tract by the share of its area in each grade, every census block's
+#population is assigned to the grades its area falls in, and the tract's grade fractions are the
+#shares of its population living in each grade. Blocks are streamed from the shapefile in chunks,
+#overlaid against one STRtree of the HOLC polygons, and summed up per tract, so memory stays
+#bounded by the chunk size and the number of tracts, not the number of blocks.
+#the result has the same id/A/B/C/D/U columns as intersect_tract_grades
+#
+#the block file is the census TIGER/Line "tabblock2010_<state>_pophu" shapefile, which has the
+#2010 population (POP10) of every block (BLOCKID10)
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import shapely
+from pyogrio import read_info
+
+from redlining import instrument
+from redlining.overlay import GRADES, category_layer, overlay_fractions
+from redlining.tracts import BATCH_SIZE, stream_features
+
+TRACT_PREFIX = "1400000US"
+
+
+#the tract GEO_ID of every block: state (2) + county (3) + tract (6) digits of the block id
+def block_tract_ids(block_ids):
+    return TRACT_PREFIX + pd.Series(block_ids, dtype=str).str[:11]
+
+
+#population-weighted grade fractions per tract, from the blocks in blocks_path. geo_ids limits
+#the tracts (e.g. to one county); tracts without population fall back to block-area weights
+def block_grade_fractions(blocks_path, hoods_df, geo_ids=None, grades=GRADES, grade_col="holc_grade",
+                          block_id_col="BLOCKID10", pop_col="POP10", batch_size=BATCH_SIZE):
+
+    crs = read_info(blocks_path)["crs"]
+    if hoods_df.crs is not None and crs is not None and hoods_df.crs != crs:
+        hoods_df = hoods_df.to_crs(crs)
+    poly_geoms, cat_idx, grades = category_layer(hoods_df, grade_col, grades)
+    tree = shapely.STRtree(poly_geoms)
+    n_grades = len(grades)
+
+    keep = None
+    if geo_ids is not None:
+        wanted = pa.array(pd.unique(pd.Series(np.asarray(geo_ids, dtype=str)).str[len(TRACT_PREFIX):]))
+        keep = lambda batch: pc.is_in(pc.utf8_slice_codeunits(batch[block_id_col], 0, 11), value_set=wanted)
+
+    #per-chunk tract sums; only tract-level rows are kept between chunks
+    sums = []
+    for attrs, block_geoms, _ in stream_features(blocks_path, [block_id_col, pop_col], keep=keep,
+                                                 batch_size=batch_size):
+        instrument.add(blocks=len(block_geoms))
+        area = shapely.area(block_geoms)
+        fractions = overlay_fractions(block_geoms, tree, cat_idx, n_grades, area)
+        pop = attrs[pop_col].to_numpy(dtype=np.float64)
+        chunk = pd.DataFrame(np.column_stack([pop, fractions*pop[:, None], area, fractions*area[:, None]]))
+        chunk["id"] = block_tract_ids(attrs[block_id_col]).to_numpy()
+        sums.append(chunk.groupby("id").sum())
+
+    columns = ["population"] + [f"pop_{g}" for g in grades] + ["area"] + [f"area_{g}" for g in grades]
+    if sums:
+        totals = pd.concat(sums).groupby(level=0).sum()
+        totals.columns = columns
+    else:
+        totals = pd.DataFrame(columns=columns, dtype=float)
+    if geo_ids is not None:
+        totals = totals.reindex(pd.unique(np.asarray(geo_ids, dtype=str)), fill_value=0)
+
+    population = totals["population"].to_numpy()
+    pop_in_grade = totals[[f"pop_{g}" for g in grades]].to_numpy()
+    area = totals["area"].to_numpy()
+    area_in_grade = totals[[f"area_{g}" for g in grades]].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(population[:, None] > 0, pop_in_grade/population[:, None], area_in_grade/area[:, None])
+    out = np.nan_to_num(out)
+
+    out_df = pd.DataFrame(out, columns=grades)
+    out_df.insert(0, "id", totals.index.to_numpy())
+    #'U' is for "unassigned" to a redlining tract
+    out_df["U"] = 1-out.sum(axis=1)
+    out_df["population"] = population
+    return out_df
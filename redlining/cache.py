@@ -0,0 +1,133 @@
+#on-disk cache for the tract/HOLC overlay, so re-running the analysis skips the geometry work
+#entries are keyed by a hash of the input geometries, the category column, the categories and the CRS,
+#so a changed shapefile just gives a new key; old entries are dropped least-recently-used first
+#once the cache directory grows past max_bytes
+#(the kernel density curves of redlining/density.py are cached in the same directory)
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from redlining import instrument
+
+CACHE_DIR = os.environ.get("REDLINING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "houston_redlining"))
+MAX_BYTES = 512*1024**2
+
+
+#hash of a layer's geometries (as WKB) and CRS, plus any extra attribute columns that matter
+def layer_hash(gdf, columns=()):
+    import shapely
+
+    h = hashlib.sha256()
+    h.update(str(gdf.crs).encode())
+    for wkb in shapely.to_wkb(np.asarray(gdf.geometry.values, dtype=object)):
+        h.update(wkb if wkb is not None else b"\0")
+    for col in columns:
+        h.update(col.encode())
+        h.update(pd.util.hash_pandas_object(gdf[col], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def overlay_key(tracts_df, polygons_df, category_col, categories, crs=None, grid_size=None):
+    h = hashlib.sha256()
+    h.update(layer_hash(tracts_df).encode())
+    h.update(layer_hash(polygons_df, [category_col]).encode())
+    h.update(repr(list(categories)).encode())
+    #(left out when unset, so entries from before these options keep their keys)
+    if crs is not None or grid_size is not None:
+        h.update(repr((str(crs), grid_size)).encode())
+    return h.hexdigest()
+
+
+#drop the least recently used entries until the cache is under max_bytes.
+#batch workers can share a cache directory, so an entry may disappear (evicted by another process)
+#at any point; a missing file is skipped here and is a miss in read_entry
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".parquet"):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+#a cached table, or None if there is no entry (or another process just evicted it).
+#the entry is touched so eviction treats it as recently used
+def read_entry(path):
+    try:
+        os.utime(path)
+        return pd.read_parquet(path)
+    except FileNotFoundError:
+        return None
+
+
+#write to a temporary name (one per process) first, so a crashed run never leaves a half-written
+#entry and two processes writing the same entry do not write into each other's file
+def write_entry(frame, path, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_bytes)
+
+
+#cached version of area_fraction_matrix, same arguments and return value
+#(workers is not part of the key, the parallel overlay gives bit-identical results)
+def cached_area_fraction_matrix(tracts_df, polygons_df, category_col, categories=None,
+                                cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, workers=1, crs=None, grid_size=None):
+    from redlining.overlay import area_fraction_matrix
+
+    if categories is None:
+        categories = sorted(polygons_df[category_col].dropna().unique())
+    categories = list(categories)
+
+    path = os.path.join(cache_dir, overlay_key(tracts_df, polygons_df, category_col, categories, crs, grid_size) + ".parquet")
+    cached = read_entry(path)
+    if cached is not None:
+        instrument.add(cache_hits=1)
+        return cached[[str(c) for c in categories]].to_numpy(), categories
+
+    instrument.add(cache_misses=1)
+    fractions, categories = area_fraction_matrix(tracts_df, polygons_df, category_col, categories, workers,
+                                                 crs=crs, grid_size=grid_size)
+    write_entry(pd.DataFrame(fractions, columns=[str(c) for c in categories]), path, cache_dir, max_bytes)
+    return fractions, categories
+
+
+#cached version of dissolve_by_category, stored as WKB in the same cache directory
+def cached_dissolve(polygons_df, category_col, categories=None, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    import shapely
+    from redlining.overlay import dissolve_by_category
+
+    if categories is None:
+        categories = sorted(polygons_df[category_col].dropna().unique())
+    categories = list(categories)
+
+    h = hashlib.sha256()
+    h.update(b"dissolve;")
+    h.update(layer_hash(polygons_df, [category_col]).encode())
+    h.update(repr(categories).encode())
+    path = os.path.join(cache_dir, h.hexdigest() + ".parquet")
+    cached = read_entry(path)
+    if cached is not None:
+        return np.asarray(shapely.from_wkb(cached["wkb"].to_numpy()), dtype=object), categories
+
+    dissolved, categories = dissolve_by_category(polygons_df, category_col, categories)
+    write_entry(pd.DataFrame({"category": [str(c) for c in categories], "wkb": shapely.to_wkb(dissolved)}),
+                path, cache_dir, max_bytes)
+    return dissolved, categories
@@ -0,0 +1,185 @@
+#ingestion of the census ACS 5-year B02001 (race) tables
+#any number of vintages are read into one long (tract, year, group) table of shares.
+#as in the notebook, "other" is every single-race group except white and black alone,
+#and "mixed" is "two or more races"
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+RACE_GROUPS = ["white","black","mixed","other"]
+
+#B02001 estimate columns: total, white alone, black alone, two or more races
+B02001_COLUMNS = {"B02001_001E": "total",
+                  "B02001_002E": "white",
+                  "B02001_003E": "black",
+                  "B02001_008E": "mixed"}
+
+
+#year of an ACS download from its file name, e.g. ACSDT5Y2018.B02001_data_with_overlays_....csv
+def acs_year(path):
+    match = re.search(r"ACSDT\dY(\d{4})", os.path.basename(path))
+    if match is None:
+        raise ValueError(f"can't tell the ACS year from the file name {path!r}, pass {{year: path}} instead")
+    return int(match.group(1))
+
+
+#one year's B02001 download, as GEO_ID, year and the count columns
+def read_b02001_counts(year, path):
+    #row 0 is the machine-readable header, row 1 repeats it as long labels
+    raw = pd.read_csv(path, skiprows=[1], usecols=["GEO_ID"]+list(B02001_COLUMNS),
+                      dtype={"GEO_ID": str}, na_values=["null","(X)","-"])
+    raw.insert(1, "year", np.int16(year))
+    return raw
+
+
+#read B02001 tables for many years (and counties) into a long table with columns id, year, group,
+#total, share. sources is either a list of paths (years taken from the file names) or a
+#{year: path or [paths]} dict; the files of the same year (e.g. one per county) are stacked.
+#a tract that appears twice in the same year is an error. with workers > 1 the files are parsed
+#concurrently in threads
+def read_b02001(sources, workers=1):
+
+    if isinstance(sources, dict):
+        files = [(year, path) for year, paths in sources.items()
+                 for path in ([paths] if isinstance(paths, (str, os.PathLike)) else paths)]
+    else:
+        files = [(acs_year(path), path) for path in sources]
+
+    years, paths = zip(*sorted(files, key=lambda f: f[0])) if files else ((), ())
+    if workers > 1 and len(paths) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(read_b02001_counts, years, paths))
+    else:
+        frames = [read_b02001_counts(year, path) for year, path in zip(years, paths)]
+    raw = pd.concat(frames, ignore_index=True)
+    duplicated = raw.duplicated(["GEO_ID","year"])
+    if duplicated.any():
+        first = raw.loc[duplicated].iloc[0]
+        raise ValueError(f"{duplicated.sum()} tracts appear more than once in the same year's files "
+                         f"(e.g. {first['GEO_ID']} in {first['year']}); is a file listed twice?")
+
+    #shares for every tract and year at once
+    counts = raw[list(B02001_COLUMNS)].to_numpy(dtype=np.float64)
+    total = counts[:,0:1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = counts[:,1:]/total
+    shares = np.column_stack([shares, 1-shares.sum(axis=1)]).astype(np.float32)
+
+    n_rows, n_groups = shares.shape
+    return pd.DataFrame({
+        "id": pd.Categorical(np.repeat(raw["GEO_ID"].to_numpy(), n_groups)),
+        "year": np.repeat(raw["year"].to_numpy(), n_groups),
+        "group": pd.Categorical.from_codes(np.tile(np.arange(n_groups), n_rows), RACE_GROUPS),
+        "total": np.repeat(total[:,0].astype(np.float32), n_groups),
+        "share": shares.ravel(),
+    })
+
+
+#wide table in the notebook's layout (id, total_<year>, percent_<group>_<year>, ...),
+#keeping only tracts present in every year like the original inner merge
+def race_shares_wide(race_long):
+
+    #pivot_table would silently average duplicated rows
+    if race_long.duplicated(["id","year","group"]).any():
+        raise ValueError("race_long has more than one row for some (id, year, group)")
+    shares = race_long.pivot_table(index="id", columns=["year","group"], values="share",
+                                   observed=True, dropna=False)
+    totals = race_long.drop_duplicates(["id","year"]).pivot(index="id", columns="year", values="total")
+
+    out = {}
+    for year in sorted(race_long["year"].unique()):
+        out[f"total_{year}"] = totals[year]
+        for group in RACE_GROUPS:
+            out[f"percent_{group}_{year}"] = shares[(year, group)]
+    wide = pd.DataFrame(out)
+
+    present = race_long.groupby("id", observed=True)["year"].nunique() == race_long["year"].nunique()
+    wide = wide.loc[present[present].index]
+    wide.index = wide.index.astype(str)
+    return wide.rename_axis("id").reset_index()
+
+
+#column names the notebook uses for the change in each group's share
+CHANGE_COLUMNS = {"white": "white_only_change",
+                  "black": "black_only_change",
+                  "other": "other_only_change",
+                  "mixed": "mixed_change"}
+
+
+#(tract x year x group) array of shares from the long table (or a wide table in the notebook's
+#layout), with the tract ids, years and groups along each axis. missing tract-years are NaN
+def share_array(race):
+
+    if "group" not in race:
+        years = sorted({int(c.rsplit("_", 1)[1]) for c in race.columns if c.startswith("percent_")})
+        cols = [f"percent_{g}_{y}" for y in years for g in RACE_GROUPS]
+        shares = race[cols].to_numpy(dtype=np.float32).reshape(len(race), len(years), len(RACE_GROUPS))
+        return np.asarray(race["id"]), years, list(RACE_GROUPS), shares
+
+    tract = pd.Categorical(race["id"])
+    year = pd.Categorical(race["year"])
+    group = pd.Categorical(race["group"])
+    shares = np.full((len(tract.categories), len(year.categories), len(group.categories)), np.nan, dtype=np.float32)
+    shares[tract.codes, year.codes, group.codes] = race["share"].to_numpy()
+    return np.asarray(tract.categories), list(year.categories), list(group.categories), shares
+
+
+#change in every group's share for each (start, end) pair of years, all pairs with start < end
+#if pairs is None. one broadcasted subtraction over the (tract x year x group) array; the
+#result is a tidy table with columns id, start, end, group, change
+def race_changes(race, pairs=None):
+
+    ids, years, groups, shares = share_array(race)
+    if pairs is None:
+        pairs = [(a, b) for i, a in enumerate(years) for b in years[i+1:]]
+    year_pos = {y: i for i, y in enumerate(years)}
+    start = np.array([year_pos[a] for a, _ in pairs], dtype=np.intp)
+    end = np.array([year_pos[b] for _, b in pairs], dtype=np.intp)
+
+    #(tract x pair x group)
+    change = shares[:, end, :] - shares[:, start, :]
+
+    n_tracts, n_pairs, n_groups = change.shape
+    pair_start = np.array([a for a, _ in pairs])
+    pair_end = np.array([b for _, b in pairs])
+    return pd.DataFrame({
+        "id": pd.Categorical(np.repeat(ids, n_pairs*n_groups)),
+        "start": np.tile(np.repeat(pair_start, n_groups), n_tracts),
+        "end": np.tile(np.repeat(pair_end, n_groups), n_tracts),
+        "group": pd.Categorical.from_codes(np.tile(np.arange(n_groups), n_tracts*n_pairs), groups),
+        "change": change.ravel(),
+    })
+
+
+#add the change in each group's share between two years to a wide table, rounded like the notebook
+def add_race_change(wide, start=2010, end=2018, decimals=2):
+    groups = list(CHANGE_COLUMNS)
+    change = wide[[f"percent_{g}_{end}" for g in groups]].to_numpy() - wide[[f"percent_{g}_{start}" for g in groups]].to_numpy()
+    wide[[CHANGE_COLUMNS[g] for g in groups]] = change.round(decimals)
+    return wide
+
+
+#python -m redlining.census ACSDT5Y2010...csv ACSDT5Y2018...csv --out race_long.parquet
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="read ACS B02001 tables into one long race-share table")
+    parser.add_argument("acs", nargs="+", help="B02001 csv downloads (the year is taken from the file name)")
+    parser.add_argument("--out", required=True, help="output .parquet or .csv")
+    args = parser.parse_args(argv)
+
+    race_long = read_b02001(args.acs)
+    if args.out.endswith(".csv"):
+        race_long.to_csv(args.out, index=False)
+    else:
+        race_long.to_parquet(args.out, index=False)
+    print(f"{args.out}: {len(race_long)} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,8 @@
+#constants shared across the package. this module imports nothing, so the command line and the
+#lower-level modules (sources, stats...) can use them without loading shapely or the pipeline
+GRADES = ["A","B","C","D"]
+#CONUS Albers equal-area, for overlays whose area ratios should not depend on the input CRS
+#(in geographic degrees a square degree is smaller the further north it is)
+EQUAL_AREA_CRS = "EPSG:5070"
+#the files that make up a shapefile (fingerprinted and fetched together)
+SHAPEFILE_PARTS = [".shp",".shx",".dbf",".prj",".cpg"]
@@ -0,0 +1,21 @@
+#the hand-curated race-limiting deed restriction table (deed_restrictions.csv)
+import pandas as pd
+
+#prefix that turns the 6-digit 2010 tract number into the census GEO_ID (Harris county, TX)
+HARRIS_TRACT_PREFIX = "1400000US48201"
+DEED_COLUMNS = ["Neighborhood","restriction","degree"]
+
+
+def read_deeds(path, tract_prefix=HARRIS_TRACT_PREFIX):
+    deeds = pd.read_csv(path)
+    #process the tract name so that it can be merged
+    deeds["id"] = tract_prefix + deeds["tract_2010"].astype(str)
+    return deeds
+
+
+#left-join the deed table onto the tracts and mark tracts without a deed record as "unknown".
+#tracts shared by two neighborhoods (e.g. Oak Forest East/West) appear once per neighborhood
+def join_deeds(tracts, deeds):
+    merged = tracts.merge(deeds, how="left", on="id")
+    merged[DEED_COLUMNS] = merged[DEED_COLUMNS].fillna("unknown")
+    return merged
@@ -0,0 +1,153 @@
+#kernel density curves for grouped distributions (cell In[184]: the change in each group's share,
+#split by deed restriction status)
+#pandas' plot(kind='kde') fits a scipy gaussian_kde and evaluates it on its own grid for every
+#column and subset. Here all the (column x category) curves are evaluated on one shared grid in a
+#single vectorized pass, either exactly (sum of Gaussians) or by linear binning + FFT convolution,
+#and the curves are cached on disk. Drawing them is a separate step (redlining.render.draw_density)
+#
+#bw_method is the same as for scipy.stats.gaussian_kde / pandas: a scalar factor times each
+#curve's sample standard deviation ("scott" and "silverman" give the usual rules)
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+GRID_SIZE = 1000
+#samples per block in the exact method, bounds the (samples x grid) kernel matrix
+CHUNK = 4096
+
+
+#bandwidth factor for a curve with n samples
+def bandwidth_factor(bw_method, n):
+    if bw_method == "scott":
+        return n**(-1/5)
+    if bw_method == "silverman":
+        return (n*3/4)**(-1/5)
+    return float(bw_method)
+
+
+#shared evaluation grid, spread like pandas' (the data range plus half of it on each side)
+def density_grid(values, size=GRID_SIZE):
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return np.linspace(-1, 1, size)
+    low, high = values.min(), values.max()
+    span = high-low if high > low else 1.0
+    return np.linspace(low-span/2, high+span/2, size)
+
+
+#densities of several samples on one grid. keys (ints 0..n_curves-1) says which curve each value
+#belongs to; returns a (n_curves x grid) array, rows of curves with fewer than 2 values are NaN.
+#method "exact" sums the Gaussians directly, "fft" bins the values onto the (evenly spaced) grid
+#and convolves, which is O(grid log grid) per curve however many values there are; values
+#outside the grid are clipped to its ends
+def kde_curves(values, keys, n_curves, grid, bw_method=0.5, method="exact"):
+
+    values = np.asarray(values, dtype=float)
+    keys = np.asarray(keys, dtype=np.intp)
+    grid = np.asarray(grid, dtype=float)
+    valid = np.isfinite(values) & (keys >= 0)
+    values = values[valid]
+    keys = keys[valid]
+
+    counts = np.bincount(keys, minlength=n_curves)
+    sums = np.bincount(keys, weights=values, minlength=n_curves)
+    squares = np.bincount(keys, weights=values**2, minlength=n_curves)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sums/counts
+        std = np.sqrt(np.maximum(squares-counts*mean**2, 0)/(counts-1))
+    factor = np.array([bandwidth_factor(bw_method, n) if n > 0 else np.nan for n in counts])
+    bandwidth = factor*std
+    usable = (counts > 1) & (bandwidth > 0)
+
+    curves = np.zeros((n_curves, len(grid)))
+    keep = usable[keys]
+    values = values[keep]
+    keys = keys[keep]
+    if method == "exact":
+        norm = 1/(np.sqrt(2*np.pi)*bandwidth*counts)
+        for start in range(0, len(values), CHUNK):
+            x = values[start:start+CHUNK]
+            k = keys[start:start+CHUNK]
+            z = (grid[None, :]-x[:, None])/bandwidth[k][:, None]
+            kernels = np.exp(-z**2/2)*norm[k][:, None]
+            #sum the kernel rows of each curve (one matrix product instead of a loop over curves)
+            onehot = np.zeros((n_curves, len(x)))
+            onehot[k, np.arange(len(x))] = 1
+            curves += onehot @ kernels
+    elif method == "fft":
+        step = grid[1]-grid[0]
+        #linear binning: every value is split between its two neighbouring grid points
+        pos = np.clip((values-grid[0])/step, 0, len(grid)-1)
+        left = np.minimum(np.floor(pos).astype(np.intp), len(grid)-2)
+        right_weight = pos-left
+        binned = np.zeros((n_curves, len(grid)))
+        np.add.at(binned, (keys, left), 1-right_weight)
+        np.add.at(binned, (keys, left+1), right_weight)
+        #zero padding wide enough that the kernels do not wrap around
+        pad = int(np.ceil(5*np.nanmax(np.where(usable, bandwidth, 0), initial=0)/step))
+        size = 1 << int(np.ceil(np.log2(len(grid)+pad)))
+        freq = np.fft.rfftfreq(size, d=step)
+        #Fourier transform of a unit Gaussian with each curve's bandwidth
+        kernel_ft = np.exp(-2*(np.pi*freq[None, :]*np.nan_to_num(bandwidth)[:, None])**2)
+        smoothed = np.fft.irfft(np.fft.rfft(binned, n=size, axis=1)*kernel_ft, n=size, axis=1)[:, :len(grid)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            curves = np.maximum(smoothed, 0)/(counts[:, None]*step)
+    else:
+        raise ValueError(f"unknown method {method!r}, expected 'exact' or 'fft'")
+
+    curves[~usable] = np.nan
+    return curves
+
+
+#density curves of each column in columns, split by the categories of the `by` column, on one
+#shared grid (by default spanning all the columns' values). returns a tidy frame with
+#column, category, x and density
+def density_curves(table, columns, by, grid=None, bw_method=0.5, method="exact", grid_size=GRID_SIZE):
+
+    columns = list(columns)
+    groups = pd.Categorical(table[by])
+    n_cat = len(groups.categories)
+    values = np.concatenate([table[c].to_numpy(dtype=float) for c in columns])
+    #curve of every value: (column, category) -> column*n_cat + category
+    keys = np.concatenate([np.where(groups.codes >= 0, i*n_cat+groups.codes, -1) for i in range(len(columns))])
+    if grid is None:
+        grid = density_grid(values, grid_size)
+    grid = np.asarray(grid, dtype=float)
+
+    curves = kde_curves(values, keys, len(columns)*n_cat, grid, bw_method, method)
+    return pd.DataFrame({
+        "column": pd.Categorical(np.repeat(columns, n_cat*len(grid)), categories=columns),
+        "category": pd.Categorical(np.tile(np.repeat(groups.categories, len(grid)), len(columns)),
+                                   categories=groups.categories),
+        "x": np.tile(grid, len(columns)*n_cat),
+        "density": curves.ravel(),
+    })
+
+
+#density_curves, cached in the overlay cache directory (see redlining/cache.py) by a hash of the
+#values, the categories and the settings
+def cached_density_curves(table, columns, by, grid=None, bw_method=0.5, method="exact", grid_size=GRID_SIZE,
+                          cache_dir=None, max_bytes=None):
+    from redlining.cache import CACHE_DIR, MAX_BYTES, read_entry, write_entry
+
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    h = hashlib.sha256()
+    h.update(b"density;")
+    for col in list(columns)+[by]:
+        h.update(col.encode())
+        h.update(pd.util.hash_pandas_object(table[col], index=False).to_numpy().tobytes())
+    h.update(repr((bw_method, method, grid_size)).encode())
+    if grid is not None:
+        h.update(np.asarray(grid, dtype=float).tobytes())
+    path = os.path.join(cache_dir, h.hexdigest() + ".parquet")
+    cached = read_entry(path)
+    if cached is not None:
+        return cached
+
+    curves = density_curves(table, columns, by, grid, bw_method, method, grid_size)
+    write_entry(curves, path, cache_dir, max_bytes)
+    return curves
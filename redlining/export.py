@@ -0,0 +1,97 @@
+#columnar export of the final tract table (race shares, changes, grade fractions, deed status)
+#and a reader that opens it without loading it
+#the Arrow IPC (Feather v2) file is written uncompressed so it can be memory-mapped: opening it
+#only reads the schema, and the columns a caller touches are paged in from the file on demand
+#(zero-copy). Geometry is stored as WKB in a binary "geometry" column, with the CRS in the
+#schema metadata. Parquet is also supported, for smaller files that are read column by column
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from redlining.store import TractStore
+
+CRS_KEY = b"redlining:crs"
+
+
+#Arrow table for a (Geo)DataFrame: string columns dictionary-encoded, geometry as WKB
+def to_arrow(table):
+    import shapely
+
+    frame = pd.DataFrame(table.drop(columns=table.geometry.name))
+    for name in frame.columns:
+        if frame[name].dtype == object or pd.api.types.is_string_dtype(frame[name]):
+            frame[name] = frame[name].astype("category")
+    arrow = pa.Table.from_pandas(frame, preserve_index=False)
+    wkb = shapely.to_wkb(np.asarray(table.geometry.values, dtype=object))
+    arrow = arrow.append_column("geometry", pa.array(wkb, type=pa.binary()))
+    crs = table.crs.to_json() if getattr(table, "crs", None) is not None else ""
+    return arrow.replace_schema_metadata({**(arrow.schema.metadata or {}), CRS_KEY: crs.encode()})
+
+
+#write the tract table to path (.feather/.arrow: uncompressed Arrow IPC, .parquet: Parquet)
+def write_results(table, path):
+    arrow = to_arrow(table)
+    if path.endswith(".parquet"):
+        pq.write_table(arrow, path)
+    else:
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, arrow.schema) as writer:
+                writer.write_table(arrow)
+    return path
+
+
+#open a results file as an Arrow table. Arrow IPC files are memory-mapped (nothing is read until a
+#column is used); for Parquet only the requested columns are read
+def open_results(path, columns=None):
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=columns, memory_map=True)
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table if columns is None else table.select(columns)
+
+
+def results_crs(arrow):
+    crs = (arrow.schema.metadata or {}).get(CRS_KEY, b"").decode()
+    return crs or None
+
+
+#GeoDataFrame for some columns/rows of an opened results table
+def results_geodataframe(arrow, columns=None, mask=None):
+    import geopandas as gpd
+    import shapely
+
+    if mask is not None:
+        arrow = arrow.filter(pa.array(mask))
+    names = [c for c in (columns or arrow.column_names) if c != "geometry"]
+    frame = arrow.select(names).to_pandas()
+    geometry = None
+    if "geometry" in arrow.column_names:
+        geometry = shapely.from_wkb(arrow["geometry"].to_numpy(zero_copy_only=False))
+    return gpd.GeoDataFrame(frame, geometry=geometry, crs=results_crs(arrow))
+
+
+#TractStore over an opened results table. numeric columns without missing values and the WKB
+#buffer are views of the (memory-mapped) Arrow buffers, not copies
+def results_store(arrow):
+    arrow = arrow.combine_chunks()
+    columns = {}
+    categories = {}
+    for name in arrow.column_names:
+        if name == "geometry":
+            continue
+        col = arrow[name].chunk(0) if arrow[name].num_chunks else pa.array([], type=arrow[name].type)
+        if pa.types.is_dictionary(col.type):
+            columns[name] = col.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+            categories[name] = pd.Index(col.dictionary.to_pylist())
+        elif pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+            cat = pd.Categorical(col.to_pandas())
+            columns[name] = cat.codes
+            categories[name] = cat.categories
+        else:
+            columns[name] = col.to_numpy(zero_copy_only=False)
+
+    geoms = arrow["geometry"].chunk(0) if arrow["geometry"].num_chunks else pa.array([], type=pa.binary())
+    _, offsets_buf, data_buf = geoms.buffers()
+    offsets = np.frombuffer(offsets_buf, dtype=np.int32)[geoms.offset:geoms.offset+len(geoms)+1].astype(np.int64)
+    wkb = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None else np.zeros(0, dtype=np.uint8)
+    return TractStore(wkb, offsets, np.arange(len(geoms)), columns, categories, results_crs(arrow))
@@ -0,0 +1,129 @@
+#per-stage instrumentation of the pipeline
+#switched off by default (then stage() and add() do nothing); switch it on with enable() or by
+#setting REDLINING_PROFILE=1. every stage records wall time, CPU time, the process's peak RSS so far,
+#and any counts the code adds to it (rows, geometries, candidate pairs, exact intersections...).
+#Stages can be nested. With enable(trace_memory=True) (or REDLINING_TRACE_MEMORY=1) they also record
+#the peak memory traced by tracemalloc while they ran. This is off by default: tracemalloc slows the
+#pandas stages down several times (and not the GEOS ones), which skews the timings, and it does not
+#see GEOS or GDAL allocations anyway, so the RSS is the better measure for the overlay
+#write_trace() saves the stages as Chrome trace events, which open in chrome://tracing, Perfetto
+#(ui.perfetto.dev) or speedscope as a timeline/flame graph
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+ENABLED = os.environ.get("REDLINING_PROFILE", "") not in ("", "0")
+TRACE_MEMORY = os.environ.get("REDLINING_TRACE_MEMORY", "") not in ("", "0")
+
+records = []
+local = threading.local()
+
+
+def enable(trace_memory=False):
+    global ENABLED, TRACE_MEMORY
+    ENABLED = True
+    TRACE_MEMORY = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global ENABLED, TRACE_MEMORY
+    ENABLED = False
+    TRACE_MEMORY = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    records.clear()
+
+
+def max_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on macOS, KB on Linux
+    return peak/1024**2 if sys.platform == "darwin" else peak/1024
+
+
+def stack():
+    if not hasattr(local, "stack"):
+        local.stack = []
+    return local.stack
+
+
+#time a block of code as a stage: with instrument.stage("overlay", tracts=len(tracts)): ...
+@contextlib.contextmanager
+def stage(name, **counts):
+    if not ENABLED:
+        yield None
+        return
+
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    parents = stack()
+    record = {"name": name, "counts": dict(counts), "peak_bytes": None, "depth": len(parents),
+              "pid": os.getpid(), "tid": threading.get_ident()}
+    if tracemalloc.is_tracing():
+        #the parent's peak so far is kept before the peak counter is reset for this stage
+        _, peak = tracemalloc.get_traced_memory()
+        if parents:
+            parents[-1]["peak_bytes"] = max(parents[-1]["peak_bytes"] or 0, peak)
+        tracemalloc.reset_peak()
+    parents.append(record)
+    record["start"] = time.time()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = time.perf_counter()-start_wall
+        record["cpu_s"] = time.process_time()-start_cpu
+        parents.pop()
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            record["peak_bytes"] = max(record["peak_bytes"] or 0, peak)
+            if parents:
+                parents[-1]["peak_bytes"] = max(parents[-1]["peak_bytes"] or 0, record["peak_bytes"])
+        #None when memory is not traced
+        peak_bytes = record.pop("peak_bytes")
+        record["peak_mb"] = None if peak_bytes is None else peak_bytes/1024**2
+        record["max_rss_mb"] = max_rss_mb()
+        records.append(record)
+
+
+#add counts to the innermost running stage (no-op when disabled or outside a stage)
+def add(**counts):
+    if not ENABLED or not stack():
+        return
+    current = stack()[-1]["counts"]
+    for key, n in counts.items():
+        current[key] = current.get(key, 0) + n
+
+
+#finished stages as plain dicts, in the order they finished
+def summary():
+    return [{key: (round(value, 4) if isinstance(value, float) else value) for key, value in r.items()}
+            for r in records]
+
+
+def write_json(path):
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=2)
+
+
+#Chrome trace-event file ("X" complete events, times in microseconds)
+def write_trace(path):
+    events = []
+    for r in records:
+        args = {"cpu_s": round(r["cpu_s"], 4), "max_rss_mb": round(r["max_rss_mb"], 1), **r["counts"]}
+        if r["peak_mb"] is not None:
+            args["peak_mb"] = round(r["peak_mb"], 2)
+        events.append({"name": r["name"], "ph": "X", "pid": r["pid"], "tid": r["tid"],
+                       "ts": r["start"]*1e6, "dur": r["wall_s"]*1e6, "args": args})
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
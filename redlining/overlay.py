@@ -0,0 +1,278 @@
+#overlay of census tracts with the historical HOLC (redlining) polygons
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+from redlining import instrument
+from redlining.constants import EQUAL_AREA_CRS, GRADES
+
+
+#function that quantifies the percent of a modern tract that is in a neighborhood from the redlining data
+#this is the original pairwise version, kept as the reference for the faster engine below
+def intersect_tract_hood(tracts_df, hoods_df, colname):
+
+    geom_tract = [shape(feat["geometry"]) for k, feat in tracts_df.iterrows()]
+    geom_hood = [shape(feat["geometry"]) for k, feat in hoods_df.iterrows()]
+
+    out_df = pd.DataFrame(tracts_df["id"])
+    out_df[colname] = 0.0
+
+    for i, tract in enumerate(geom_tract):
+        for j, hood in enumerate(geom_hood):
+            if tract.intersects(hood):
+                out_df.loc[i,colname] += tract.intersection(hood).area/tract.area
+
+    return(out_df)
+
+
+#a precision grid is only meaningful in a projected CRS: in degrees, a grid of 1 would snap every
+#tract to a point. crs is the CRS the overlay is measured in
+def check_grid_crs(crs, grid_size):
+    if grid_size is None:
+        return
+    from pyproj import CRS
+    if crs is None or CRS.from_user_input(crs).is_geographic:
+        raise ValueError(f"grid_size {grid_size} needs a projected CRS (in meters, e.g. {EQUAL_AREA_CRS}), "
+                         f"but the overlay is measured in {crs}")
+
+
+#both layers in crs (each projected once, and only if needed), as geometry arrays. with grid_size
+#the coordinates are snapped to a grid of that size (in crs units, so crs must be projected), which
+#also makes the polygons valid, and intersections are computed on the same grid
+def overlay_layers(tracts_df, polygons_df, crs=None, grid_size=None):
+
+    check_grid_crs(crs if crs is not None else tracts_df.crs, grid_size)
+    if crs is not None:
+        if tracts_df.crs is not None and tracts_df.crs != crs:
+            tracts_df = tracts_df.to_crs(crs)
+        if polygons_df.crs is not None and polygons_df.crs != crs:
+            polygons_df = polygons_df.to_crs(crs)
+    tract_geoms = np.asarray(tracts_df.geometry.values, dtype=object)
+    if grid_size is not None:
+        tract_geoms = snap_to_grid(tract_geoms, grid_size)
+        polygons_df = polygons_df.set_geometry(snap_to_grid(np.asarray(polygons_df.geometry.values, dtype=object),
+                                                            grid_size), crs=polygons_df.crs)
+    return tract_geoms, polygons_df
+
+
+#set_precision for a geometry array; if an invalid polygon makes it fail, the whole array is
+#repaired with make_valid once and snapped again
+def snap_to_grid(geoms, grid_size):
+    try:
+        return shapely.set_precision(geoms, grid_size)
+    except shapely.errors.GEOSException:
+        instrument.add(topology_repairs=1)
+        return shapely.set_precision(shapely.make_valid(geoms), grid_size)
+
+
+#area of the pairwise intersections of two geometry arrays. a GEOS topology error (from invalid
+#input polygons) is handled once for the whole batch by repairing both arrays with make_valid and
+#intersecting again, instead of retrying pair by pair
+def intersection_area(a, b, grid_size=None):
+    try:
+        return shapely.area(shapely.intersection(a, b, grid_size=grid_size))
+    except shapely.errors.GEOSException:
+        instrument.add(topology_repairs=1)
+        return shapely.area(shapely.intersection(shapely.make_valid(a), shapely.make_valid(b), grid_size=grid_size))
+
+
+#fractions of each tract's area in each category, for an array of tract geometries against
+#polygons already in an STRtree. cat_idx is the category column of every polygon in the tree.
+#tract_area can be passed in when it is already known (computed once per tract otherwise)
+def overlay_fractions(tract_geoms, tree, cat_idx, n_categories, tract_area=None, grid_size=None):
+
+    fractions = np.zeros((len(tract_geoms), n_categories))
+    if len(tract_geoms) == 0 or len(cat_idx) == 0:
+        return fractions
+
+    tract_pos, poly_pos = tree.query(tract_geoms, predicate="intersects")
+    if instrument.ENABLED:
+        #bounding-box candidates are only counted when profiling (it is a second tree query)
+        instrument.add(geometries=len(tract_geoms), candidate_pairs=len(tree.query(tract_geoms)[0]),
+                       exact_intersections=len(tract_pos))
+    #fixed pair order, so every tract's sum is added up the same way however the tracts are chunked
+    order = np.lexsort((poly_pos, tract_pos))
+    tract_pos = tract_pos[order]
+    poly_pos = poly_pos[order]
+
+    if tract_area is None:
+        tract_area = shapely.area(tract_geoms)
+    overlap = intersection_area(tract_geoms[tract_pos], tree.geometries[poly_pos], grid_size)
+    #tracts that collapse to nothing on the precision grid have no area to divide by
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(tract_area[tract_pos] > 0, overlap/tract_area[tract_pos], 0)
+    np.add.at(fractions, (tract_pos, cat_idx[poly_pos]), share)
+    return fractions
+
+
+#order of points along a Hilbert curve over their bounding box, used to cut the tracts into
+#spatially compact chunks (nearby tracts end up in the same chunk and hit the same polygons)
+def hilbert_order(x, y, level=16):
+
+    side = 2**level
+    def scale(v):
+        span = v.max()-v.min()
+        return ((v-v.min())/(span if span > 0 else 1)*(side-1)).astype(np.int64)
+    x = scale(np.asarray(x, dtype=float))
+    y = scale(np.asarray(y, dtype=float))
+
+    d = np.zeros(len(x), dtype=np.int64)
+    s = side//2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s*s*((3*rx) ^ ry)
+        #rotate the quadrant
+        flip = ~ry
+        swap_x = np.where(flip & rx, s-1-x, x)
+        swap_y = np.where(flip & rx, s-1-y, y)
+        x, y = np.where(flip, swap_y, swap_x), np.where(flip, swap_x, swap_y)
+        s //= 2
+    return np.argsort(d, kind="stable")
+
+
+#polygons for the overlay worker processes, set once per worker by the pool initializer
+worker_tree = None
+worker_cat_idx = None
+
+
+def init_overlay_worker(poly_geoms, cat_idx):
+    global worker_tree, worker_cat_idx
+    worker_tree = shapely.STRtree(poly_geoms)
+    worker_cat_idx = cat_idx
+
+
+def overlay_chunk(rows, tract_geoms, n_categories, tract_area=None, grid_size=None):
+    return rows, overlay_fractions(tract_geoms, worker_tree, worker_cat_idx, n_categories, tract_area, grid_size)
+
+
+#the polygons of a categorical layer that belong to one of categories (all categories if None),
+#with the column of each polygon's category
+def category_layer(polygons_df, category_col, categories=None):
+
+    if categories is None:
+        categories = sorted(polygons_df[category_col].dropna().unique())
+    categories = list(categories)
+
+    poly_geoms = np.asarray(polygons_df.geometry.values, dtype=object)
+    #map every polygon to the column of its category (-1 for categories we are not counting)
+    cat_idx = pd.Categorical(polygons_df[category_col], categories=categories).codes.astype(np.intp)
+    keep = cat_idx >= 0
+    return poly_geoms[keep], cat_idx[keep], categories
+
+
+#area-weighted overlay of tracts with any categorical polygon layer (holc_grade, deed zones, zoning...)
+#returns a dense (tract x category) array of the fraction of each tract's area in each category,
+#in the same row order as tracts_df, plus the list of categories for the columns.
+#the polygons go into an STRtree once, the candidate (tract, polygon) pairs are found with one
+#bulk query, and the intersection areas are computed for all pairs at once.
+#with workers > 1 the tracts are cut into Hilbert-ordered chunks that are overlaid in separate
+#processes; the result is bit-identical to workers=1 (but the workers' profiling counts are not collected).
+#with crs (e.g. EQUAL_AREA_CRS) both layers are projected to it once before measuring areas, and
+#grid_size snaps both layers and the intersections to a precision grid (see overlay_layers)
+def area_fraction_matrix(tracts_df, polygons_df, category_col, categories=None, workers=1, chunks_per_worker=4,
+                         crs=None, grid_size=None):
+
+    tract_geoms, polygons_df = overlay_layers(tracts_df, polygons_df, crs, grid_size)
+    poly_geoms, cat_idx, categories = category_layer(polygons_df, category_col, categories)
+    #every tract's area, once
+    tract_area = shapely.area(tract_geoms)
+
+    if workers is None or workers <= 1 or len(tract_geoms) < 2*workers:
+        return overlay_fractions(tract_geoms, shapely.STRtree(poly_geoms), cat_idx, len(categories),
+                                 tract_area, grid_size), categories
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    centroids = shapely.centroid(tract_geoms)
+    order = hilbert_order(shapely.get_x(centroids), shapely.get_y(centroids))
+    fractions = np.zeros((len(tract_geoms), len(categories)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_overlay_worker,
+                             initargs=(poly_geoms, cat_idx)) as pool:
+        futures = [pool.submit(overlay_chunk, rows, tract_geoms[rows], len(categories), tract_area[rows], grid_size)
+                   for rows in np.array_split(order, workers*chunks_per_worker)]
+        for future in futures:
+            rows, chunk = future.result()
+            fractions[rows] = chunk
+
+    return fractions, categories
+
+
+#one valid (multi)polygon per category: make_valid on every polygon, then the union of each
+#category's polygons. returns an object array in the order of categories (None if a category is empty)
+def dissolve_by_category(polygons_df, category_col, categories=None):
+
+    if categories is None:
+        categories = sorted(polygons_df[category_col].dropna().unique())
+    categories = list(categories)
+
+    geoms = shapely.make_valid(np.asarray(polygons_df.geometry.values, dtype=object))
+    #make_valid can turn a polygon into a collection with stray lines/points, keep only the areas
+    #(Polygon 3 and MultiPolygon 6; the collection's MultiLineString 5 and MultiPoint 4 are dropped)
+    geoms = shapely.get_parts(geoms, return_index=True)
+    parts, owner = geoms
+    is_area = np.isin(shapely.get_type_id(parts), [3, 6])
+    parts = parts[is_area]
+    cat_idx = pd.Categorical(np.asarray(polygons_df[category_col])[owner[is_area]], categories=categories).codes
+
+    dissolved = np.empty(len(categories), dtype=object)
+    for i in range(len(categories)):
+        members = parts[cat_idx == i]
+        dissolved[i] = shapely.union_all(members) if len(members) else None
+    return dissolved, categories
+
+
+#area_fraction_matrix against the dissolved layer. the dissolved geometries are split back into
+#their (now merged, non-overlapping) polygons, which are prepared once and put in an STRtree.
+#a tract lying entirely inside one of them gets 1 for that category without computing an
+#intersection; only the tracts crossing a grade boundary are intersected.
+#overlapping polygons of the same category are counted once here (area_fraction_matrix adds them up).
+#crs and grid_size are as for area_fraction_matrix; a precomputed dissolved layer must already be
+#in crs (and on the grid)
+def dissolved_fraction_matrix(tracts_df, polygons_df, category_col, categories=None, dissolved=None,
+                              crs=None, grid_size=None):
+
+    tract_geoms, polygons_df = overlay_layers(tracts_df, polygons_df, crs, grid_size)
+    if dissolved is None:
+        dissolved, categories = dissolve_by_category(polygons_df, category_col, categories)
+    categories = list(categories)
+
+    fractions = np.zeros((len(tract_geoms), len(categories)))
+
+    parts, cat_idx = shapely.get_parts(np.asarray(dissolved, dtype=object), return_index=True)
+    if len(parts) == 0 or len(tract_geoms) == 0:
+        return fractions, categories
+    shapely.prepare(parts)
+
+    tree = shapely.STRtree(parts)
+    tract_pos, part_pos = tree.query(tract_geoms, predicate="intersects")
+    order = np.lexsort((part_pos, tract_pos))
+    tract_pos = tract_pos[order]
+    part_pos = part_pos[order]
+
+    inside = shapely.contains_properly(parts[part_pos], tract_geoms[tract_pos])
+    share = np.ones(len(tract_pos))
+    edge = ~inside
+    if instrument.ENABLED:
+        instrument.add(geometries=len(tract_geoms), candidate_pairs=len(tree.query(tract_geoms)[0]),
+                       contained_pairs=int(inside.sum()), exact_intersections=int(edge.sum()))
+    tract_area = shapely.area(tract_geoms)[tract_pos[edge]]
+    overlap = intersection_area(tract_geoms[tract_pos[edge]], parts[part_pos[edge]], grid_size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share[edge] = np.where(tract_area > 0, overlap/tract_area, 0)
+    np.add.at(fractions, (tract_pos, cat_idx[part_pos]), share)
+    return fractions, categories
+
+
+#same result as calling intersect_tract_hood once per grade, as an id + A/B/C/D/U table
+def intersect_tract_grades(tracts_df, hoods_df, grades=GRADES, grade_col="holc_grade", id_col="id"):
+
+    fractions, grades = area_fraction_matrix(tracts_df, hoods_df, grade_col, grades)
+
+    out_df = pd.DataFrame(fractions, columns=grades)
+    out_df.insert(0, id_col, np.asarray(tracts_df[id_col]))
+
+    #'U' is for "unassigned" to a redlining tract
+    out_df["U"] = 1-fractions.sum(axis=1)
+    return(out_df)
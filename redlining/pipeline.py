@@ -0,0 +1,408 @@
+#the notebook analysis as a dependency-tracked pipeline
+#every stage records a fingerprint of what it was computed from (its input files, the fingerprints
+#of the stages it depends on, its own code and the package's sources); on the next run a stage is
+#only re-executed when that fingerprint changed, otherwise its saved output is reused. Editing
+#deed_restrictions.csv therefore only re-runs the deed join and what comes after it, not the tract
+#load or the overlay; editing the package's code re-runs every stage.
+#
+#usage: python -m redlining.pipeline cities.json --work-dir pipeline/
+#(same manifest as redlining.batch; every city gets its own folder under the work dir)
+import argparse
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import time
+
+from redlining import instrument
+from redlining.census import read_b02001, race_shares_wide, add_race_change
+from redlining.constants import EQUAL_AREA_CRS, SHAPEFILE_PARTS
+from redlining.deeds import HARRIS_TRACT_PREFIX, read_deeds, join_deeds
+
+CHANGE_GROUPS = ["white_only_change","black_only_change","other_only_change","mixed_change"]
+
+
+#the notebook stages, shared with redlining.batch
+#the spatial stages import geopandas/shapely themselves, so the census and deed stages can run
+#without loading them
+
+#race shares for every ACS year, long format
+def prep_race(acs):
+    return read_b02001(acs)
+
+
+#tracts that are in the race data, merged with the wide race table
+def filter_tracts(tracts_path, race_long):
+    from redlining.tracts import load_tracts
+
+    return merge_race(load_tracts(tracts_path, geo_ids=race_shares_wide(race_long)["id"]), race_long)
+
+
+def merge_race(tracts, race_long):
+    return tracts.merge(race_shares_wide(race_long), how="left", left_on="GEO_ID", right_on="id")
+
+
+#the HOLC polygons, from a path or an already read GeoDataFrame (see redlining/sources.py)
+def read_holc(holc):
+    if isinstance(holc, (str, os.PathLike)):
+        import geopandas as gpd
+        return gpd.read_file(holc)
+    return holc
+
+
+#fraction of each tract in each HOLC grade, plus 'U' for unassigned.
+#with dissolve=True the HOLC layer is first merged into one valid geometry per grade
+#(see dissolved_fraction_matrix). area_crs (e.g. EQUAL_AREA_CRS) measures the areas in that
+#CRS instead of the tracts' own, and grid_size snaps the overlay to a precision grid in its units
+#(that CRS must be projected, a ValueError otherwise). the output tracts keep their original geometry
+def redline_overlay(tracts, holc_path, cache_dir=None, workers=1, dissolve=False, area_crs=None, grid_size=None):
+    from redlining.cache import cached_area_fraction_matrix, cached_dissolve
+    from redlining.overlay import (GRADES, area_fraction_matrix, check_grid_crs, dissolve_by_category,
+                                   dissolved_fraction_matrix, snap_to_grid)
+
+    crs = area_crs if area_crs is not None else tracts.crs
+    check_grid_crs(crs, grid_size)
+    with instrument.stage("read holc"):
+        hoods = read_holc(holc_path)
+        if hoods.crs is not None and crs is not None and hoods.crs != crs:
+            hoods = hoods.to_crs(crs)
+        if grid_size is not None:
+            #snapped here already so the dissolved layer is on the same grid
+            hoods = hoods.set_geometry(snap_to_grid(hoods.geometry.values, grid_size), crs=hoods.crs)
+        instrument.add(rows=len(hoods))
+    with instrument.stage("overlay"):
+        if dissolve:
+            if cache_dir is None:
+                dissolved, grades = dissolve_by_category(hoods, "holc_grade", GRADES)
+            else:
+                dissolved, grades = cached_dissolve(hoods, "holc_grade", GRADES, cache_dir=cache_dir)
+            fractions, grades = dissolved_fraction_matrix(tracts, hoods, "holc_grade", grades, dissolved,
+                                                          area_crs, grid_size)
+        elif cache_dir is None:
+            fractions, grades = area_fraction_matrix(tracts, hoods, "holc_grade", GRADES, workers,
+                                                     crs=area_crs, grid_size=grid_size)
+        else:
+            fractions, grades = cached_area_fraction_matrix(tracts, hoods, "holc_grade", GRADES, cache_dir=cache_dir,
+                                                            workers=workers, crs=area_crs, grid_size=grid_size)
+    tracts = tracts.copy()
+    tracts[grades] = fractions.round(4)
+    tracts["U"] = 1-tracts[grades].sum(axis=1)
+    return tracts
+
+
+#population-weighted version of redline_overlay from census block populations (see redlining/blocks.py)
+def redline_blocks(tracts, holc_path, blocks_path):
+    from redlining.blocks import block_grade_fractions
+    from redlining.overlay import GRADES
+
+    fractions = block_grade_fractions(blocks_path, read_holc(holc_path), geo_ids=tracts["GEO_ID"])
+    tracts = tracts.copy()
+    tracts[GRADES] = fractions[GRADES].to_numpy().round(4)
+    tracts["U"] = 1-tracts[GRADES].sum(axis=1)
+    return tracts
+
+
+#change in each group's share from the first to the last ACS year
+def race_change(tracts, race_long):
+    years = sorted(race_long["year"].unique())
+    if len(years) < 2:
+        return tracts
+    return add_race_change(tracts.copy(), years[0], years[-1])
+
+
+#deeds_path can also be an already read deed table (read_deeds)
+def deed_join(tracts, deeds_path, tract_prefix=HARRIS_TRACT_PREFIX):
+    deeds = read_deeds(deeds_path, tract_prefix) if isinstance(deeds_path, (str, os.PathLike)) else deeds_path
+    return join_deeds(tracts, deeds)
+
+
+#average change in racial composition by deed restriction status (cell In[128])
+def deed_aggregates(deeds_table):
+    return deeds_table.groupby("restriction")[CHANGE_GROUPS].mean()
+
+
+#group shares and changes by grade and top grade, area- and population-weighted (see redlining/stats.py).
+#the bootstrap replicates run on every core; the intervals do not depend on the number of workers,
+#so it is not a parameter of the stage
+def grade_stats(table, n_boot=0):
+    from redlining.stats import grade_aggregates
+    return grade_aggregates(table, n_boot=n_boot, workers=os.cpu_count())
+
+
+#five-number summaries by top grade for the boxplots (cell In[26])
+def grade_boxes(table):
+    from redlining.stats import box_stats
+    return box_stats(table)
+
+
+#density curves of the change in each group's share by deed restriction status (cell In[184])
+def deed_densities(deeds_table):
+    from redlining.density import density_curves
+    return density_curves(deeds_table, CHANGE_GROUPS, "restriction")
+
+
+#fingerprint of an input file: size and modification time of the file (and the other parts of a shapefile)
+def file_fingerprint(path):
+    stem, ext = os.path.splitext(path)
+    parts = [stem+e for e in SHAPEFILE_PARTS] if ext.lower() == ".shp" else [path]
+    h = hashlib.sha256()
+    for part in parts:
+        if os.path.exists(part):
+            stat = os.stat(part)
+            h.update(f"{os.path.basename(part)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+#hash of the redlining package's source files, computed once per process. stage functions call
+#into the rest of the package (overlay, census, blocks...), so a change anywhere in it re-runs the stages
+@functools.lru_cache(maxsize=None)
+def package_fingerprint():
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            h.update(name.encode())
+            with open(os.path.join(package_dir, name), "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+#bytecode and constants of a code object; nested code objects (lambdas, comprehensions) are hashed
+#the same way instead of by their repr, which holds a memory address
+def code_bytes(code):
+    parts = [code.co_code]
+    for const in code.co_consts:
+        parts.append(code_bytes(const) if inspect.iscode(const) else repr(const).encode())
+    return b";".join(parts)
+
+
+#fingerprint of a stage's code: its source (bytecode if the source is not available) plus the
+#package sources, so editing a stage function or anything it calls in the package re-runs it
+def code_fingerprint(func):
+    h = hashlib.sha256()
+    h.update(package_fingerprint().encode())
+    try:
+        h.update(inspect.getsource(func).encode())
+    except (OSError, TypeError):
+        h.update(code_bytes(func.__code__))
+    return h.hexdigest()
+
+
+class Pipeline:
+
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self.stages = {}
+        self.order = []
+
+    #register a stage. func is called with keyword arguments: deps maps argument names to the
+    #stages whose output they get, params are fixed arguments. params named in files are input
+    #file paths (or lists of paths) and are fingerprinted by file, the others by value. params named
+    #in untracked (e.g. worker counts) do not change the output and are left out of the fingerprint
+    def add(self, name, func, deps=None, params=None, files=(), untracked=()):
+        self.stages[name] = {"func": func, "deps": dict(deps or {}), "params": dict(params or {}), "files": list(files),
+                             "untracked": list(untracked)}
+        self.order.append(name)
+
+    def fingerprint(self, name, fingerprints):
+        stage = self.stages[name]
+        h = hashlib.sha256()
+        h.update(code_fingerprint(stage["func"]).encode())
+        for arg, dep in sorted(stage["deps"].items()):
+            h.update(f"{arg}<-{dep}:{fingerprints[dep]};".encode())
+        for key, value in sorted(stage["params"].items()):
+            if key in stage["untracked"]:
+                continue
+            if key in stage["files"]:
+                paths = value if isinstance(value, (list, tuple)) else [value]
+                value = [file_fingerprint(p) for p in paths]
+            h.update(f"{key}={value!r};".encode())
+        return h.hexdigest()
+
+    def output_path(self, name):
+        return os.path.join(self.work_dir, name + ".pkl")
+
+    def fingerprint_path(self, name):
+        return os.path.join(self.work_dir, name + ".fingerprint")
+
+    def saved_fingerprint(self, name):
+        if not os.path.exists(self.fingerprint_path(name)) or not os.path.exists(self.output_path(name)):
+            return None
+        with open(self.fingerprint_path(name)) as f:
+            return f.read().strip()
+
+    def load(self, name):
+        with open(self.output_path(name), "rb") as f:
+            return pickle.load(f)
+
+    def save(self, name, output, fingerprint):
+        tmp_path = self.output_path(name) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.output_path(name))
+        with open(self.fingerprint_path(name), "w") as f:
+            f.write(fingerprint)
+
+    #run the stages the targets need (all stages by default), re-executing only those whose
+    #fingerprint changed. returns the targets' outputs by stage name (or, without targets, the
+    #outputs of the stages that were re-run) and the list of (stage, seconds) that were executed
+    def run(self, targets=None, force=False):
+        os.makedirs(self.work_dir, exist_ok=True)
+        requested = targets
+        targets = list(targets or self.order)
+        needed = set()
+        def need(name):
+            if name not in needed:
+                needed.add(name)
+                for dep in self.stages[name]["deps"].values():
+                    need(dep)
+        for name in targets:
+            need(name)
+
+        fingerprints = {}
+        outputs = {}
+        executed = []
+        for name in self.order:
+            if name not in needed:
+                continue
+            stage = self.stages[name]
+            fingerprints[name] = self.fingerprint(name, fingerprints)
+            if not force and self.saved_fingerprint(name) == fingerprints[name]:
+                #unchanged: the saved output is only loaded if something downstream needs it
+                continue
+
+            start = time.perf_counter()
+            kwargs = dict(stage["params"])
+            for arg, dep in stage["deps"].items():
+                if dep not in outputs:
+                    with instrument.stage(f"load {dep}"):
+                        outputs[dep] = self.load(dep)
+                kwargs[arg] = outputs[dep]
+            with instrument.stage(name):
+                outputs[name] = stage["func"](**kwargs)
+                if hasattr(outputs[name], "__len__"):
+                    instrument.add(rows=len(outputs[name]))
+            with instrument.stage(f"save {name}"):
+                self.save(name, outputs[name], fingerprints[name])
+            executed.append((name, time.perf_counter()-start))
+
+        if requested is None:
+            return {name: outputs[name] for name, _ in executed}, executed
+        return {name: outputs[name] if name in outputs else self.load(name) for name in targets}, executed
+
+
+#the notebook stages for one city (a redlining.batch manifest entry)
+#n_boot bootstrap replicates give the grade statistics confidence intervals, and overlay_workers
+#processes run the chunked overlay (see overlay.area_fraction_matrix)
+def city_pipeline(city, work_dir, cache_dir=None, figure_dir=None, dissolve=False, area_crs=None, grid_size=None,
+                  n_boot=0, overlay_workers=1):
+
+    pipeline = Pipeline(work_dir)
+    pipeline.add("race", prep_race, params={"acs": city["acs"]}, files=["acs"])
+    pipeline.add("tracts", filter_tracts, deps={"race_long": "race"},
+                 params={"tracts_path": city["tracts"]}, files=["tracts_path"])
+    if city.get("blocks"):
+        pipeline.add("redline", redline_blocks, deps={"tracts": "tracts"},
+                     params={"holc_path": city["holc"], "blocks_path": city["blocks"]}, files=["holc_path","blocks_path"])
+    else:
+        pipeline.add("redline", redline_overlay, deps={"tracts": "tracts"},
+                     params={"holc_path": city["holc"], "cache_dir": cache_dir, "dissolve": dissolve,
+                             "area_crs": area_crs, "grid_size": grid_size, "workers": overlay_workers},
+                     files=["holc_path"], untracked=["workers"])
+    pipeline.add("change", race_change, deps={"tracts": "redline", "race_long": "race"})
+    pipeline.add("grade_stats", grade_stats, deps={"table": "change"}, params={"n_boot": n_boot})
+    pipeline.add("grade_boxes", grade_boxes, deps={"table": "change"})
+    pipeline.add("stats_tables", report_stats, deps={"stats": "grade_stats", "boxes": "grade_boxes"},
+                 params={"out_dir": work_dir})
+    if city.get("deeds"):
+        pipeline.add("deeds", deed_join, deps={"tracts": "change"},
+                     params={"deeds_path": city["deeds"], "tract_prefix": city.get("tract_prefix", HARRIS_TRACT_PREFIX)},
+                     files=["deeds_path"])
+        pipeline.add("aggregates", deed_aggregates, deps={"deeds_table": "deeds"})
+        pipeline.add("densities", deed_densities, deps={"deeds_table": "deeds"})
+    if figure_dir is not None:
+        pipeline.add("figures", report_maps, deps={"table": "deeds" if city.get("deeds") else "change"},
+                     params={"out_dir": figure_dir})
+        pipeline.add("grade_figure", report_grade_figure, deps={"boxes": "grade_boxes"}, params={"out_dir": figure_dir})
+        if city.get("deeds"):
+            pipeline.add("density_figure", report_densities, deps={"curves": "densities"},
+                         params={"out_dir": figure_dir})
+    return pipeline
+
+
+#the report's tract maps, written to out_dir
+def report_maps(table, out_dir):
+    from redlining.render import render_figures, report_figures
+    return render_figures(table, report_figures(table), out_dir)
+
+
+#the statistics tables as CSV for reports, and the top grade boxplot figure (cell In[26])
+def report_stats(stats, boxes, out_dir):
+    from redlining.stats import write_stats
+    return [write_stats(stats, os.path.join(out_dir, "grade_stats.csv")),
+            write_stats(boxes, os.path.join(out_dir, "grade_boxes.csv"))]
+
+
+def report_grade_figure(boxes, out_dir):
+    from redlining.render import render_grade_figure
+    return render_grade_figure(boxes, out_dir)
+
+
+#the density figure (cell In[184]), drawn from the densities stage's curves
+def report_densities(curves, out_dir):
+    from redlining.render import render_density_figure
+    return render_density_figure(curves, out_dir)
+
+
+def main(argv=None):
+    from redlining.batch import read_manifest
+    from redlining.sources import fetch_cities
+
+    parser = argparse.ArgumentParser(description="run the redlining analysis, re-running only what changed")
+    parser.add_argument("manifest", help="json list of cities (see the top of redlining/batch.py)")
+    parser.add_argument("--work-dir", default="pipeline", help="stage outputs and fingerprints (default: pipeline)")
+    parser.add_argument("--cache-dir", default=None, help="also cache the overlay results in this directory")
+    parser.add_argument("--figures", action="store_true", help="also render the report maps")
+    parser.add_argument("--dissolve", action="store_true", help="overlay against the HOLC layer dissolved by grade")
+    parser.add_argument("--force", action="store_true", help="re-run every stage")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                        help="bootstrap replicates for confidence intervals on the grade statistics (default: none)")
+    parser.add_argument("--equal-area", action="store_true", help="measure overlay areas in an equal-area CRS (EPSG:5070)")
+    parser.add_argument("--grid-size", type=float, default=None, metavar="METERS",
+                        help="snap the overlay to a precision grid of this size in meters (implies --equal-area)")
+    parser.add_argument("--overlay-workers", type=int, default=1,
+                        help="processes for the tract/HOLC overlay of a large city (default: 1, not used with --dissolve)")
+    parser.add_argument("--store", default=None, help="object store root for store:// inputs (default: $REDLINING_STORE)")
+    parser.add_argument("--fetch-dir", default=None, help="local copies of store:// inputs (default: $REDLINING_FETCH_DIR)")
+    parser.add_argument("--profile", action="store_true",
+                        help="write per-stage timings, peak RSS and counts to profile.json and profile.trace.json "
+                             "(Chrome trace events) in each city's work dir")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="with --profile, also record each stage's peak Python/NumPy memory with tracemalloc "
+                             "(slows the pandas stages down several times)")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        instrument.enable(args.trace_memory)
+    #the grid is in meters, so it is always used in the equal-area CRS
+    area_crs = EQUAL_AREA_CRS if args.equal_area or args.grid_size is not None else None
+    #store:// inputs are fetched (all cities at once) so the stages fingerprint local files
+    for city in fetch_cities(read_manifest(args.manifest), args.store, args.fetch_dir):
+        work_dir = os.path.join(args.work_dir, city["city"])
+        figure_dir = os.path.join(work_dir, "figures") if args.figures else None
+        instrument.reset()
+        pipeline = city_pipeline(city, work_dir, args.cache_dir, figure_dir, args.dissolve, area_crs, args.grid_size,
+                                 args.bootstrap, args.overlay_workers)
+        _, executed = pipeline.run(force=args.force)
+        ran = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in executed) or "nothing changed"
+        print(f"{city['city']}: {ran}")
+        if args.profile:
+            instrument.write_json(os.path.join(work_dir, "profile.json"))
+            instrument.write_trace(os.path.join(work_dir, "profile.trace.json"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#ad-hoc spatial and attribute lookups on a processed tract table (the Oak Forest section, for any
+#neighborhood, polygon or point)
+#the table is held in a TractStore; its distinct tract geometries go into one STRtree when the
+#query object is built, and an index from label to rows is built the first time a categorical
+#column (Neighborhood, restriction, ...) is looked up. Recent results are kept in an LRU cache, so
+#repeated questions are answered without touching the tree (callers get a copy of the cached result).
+#coordinates of query geometries are in the table's CRS
+#
+#usage: python -m redlining.query results/houston.feather --port 8000
+#then e.g. GET /neighborhood?name=Oak+Forest+East&name=Oak+Forest+West, GET /point?x=-95.43&y=29.83,
+#GET /bbox?minx=..&miny=..&maxx=..&maxy=.., or POST /polygon with a GeoJSON geometry;
+#add &column=... to choose the columns. Responses are JSON lists of rows
+import argparse
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from redlining.store import TractStore
+
+CACHE_SIZE = 256
+
+
+#least-recently-used cache of query results, safe to share between server threads
+class LRUCache:
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TractQuery:
+
+    def __init__(self, store, cache_size=CACHE_SIZE):
+        self.store = store
+        self.geometries = store.distinct_geometries()
+        self.tree = shapely.STRtree(self.geometries)
+        #rows of every geometry: rows_by_geom[geom_starts[g]:geom_starts[g+1]]
+        self.rows_by_geom = np.argsort(store.geom_index, kind="stable")
+        self.geom_starts = np.searchsorted(store.geom_index[self.rows_by_geom], np.arange(len(self.geometries)+1))
+        self.indexes = {}
+        self.cache = LRUCache(cache_size)
+
+    #from a results file: GeoParquet (redlining.batch) or Arrow (redlining.export, memory-mapped)
+    @classmethod
+    def open(cls, path, cache_size=CACHE_SIZE):
+        if path.endswith(".parquet"):
+            import geopandas as gpd
+            return cls(TractStore.from_frame(gpd.read_parquet(path)), cache_size)
+        from redlining.export import open_results, results_store
+        return cls(results_store(open_results(path)), cache_size)
+
+    def rows_of(self, geom_pos):
+        geom_pos = np.unique(geom_pos)
+        if len(geom_pos) == 0:
+            return np.zeros(0, dtype=np.int64)
+        starts = self.geom_starts[geom_pos]
+        ends = self.geom_starts[geom_pos+1]
+        return np.sort(np.concatenate([self.rows_by_geom[s:e] for s, e in zip(starts, ends)]))
+
+    #label -> rows index of a categorical column, built on first use
+    def index(self, name):
+        if name not in self.indexes:
+            codes = self.store.column(name)
+            order = np.argsort(codes, kind="stable")
+            starts = np.searchsorted(codes[order], np.arange(len(self.store.categories[name])+1))
+            self.indexes[name] = (order, starts)
+        return self.indexes[name]
+
+    #rows whose categorical column has one of labels
+    def lookup_rows(self, name, labels):
+        if name not in self.store.categories:
+            return np.flatnonzero(np.isin(self.store.column(name), list(labels)))
+        order, starts = self.index(name)
+        codes = self.store.categories[name].get_indexer(list(labels))
+        codes = codes[codes >= 0]
+        if len(codes) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([order[starts[c]:starts[c+1]] for c in codes]))
+
+    def result(self, rows, columns=None, geometry=False, extra=None):
+        frame = self.store.frame(columns, rows)
+        for name, values in (extra or {}).items():
+            frame[name] = values
+        if not geometry:
+            return frame
+        import geopandas as gpd
+        return gpd.GeoDataFrame(frame, geometry=self.store.geometries(rows), crs=self.store.crs)
+
+    #tracts in the named neighborhoods (or any other categorical column)
+    def neighborhood(self, names, columns=None, geometry=False, column="Neighborhood"):
+        names = [names] if isinstance(names, str) else list(names)
+        key = ("lookup", column, tuple(names), tuple(columns or ()), geometry)
+        return self.cache.get(key, lambda: self.result(self.lookup_rows(column, names), columns, geometry)).copy()
+
+    #tracts intersecting a polygon, with the share of each tract's area inside it ("overlap")
+    def polygon(self, polygon, columns=None, geometry=False):
+        key = ("polygon", shapely.to_wkb(polygon), tuple(columns or ()), geometry)
+
+        def compute():
+            geom_pos = self.tree.query(polygon, predicate="intersects")
+            geom_pos.sort()
+            tracts = self.geometries[geom_pos]
+            overlap = shapely.area(shapely.intersection(tracts, polygon))/shapely.area(tracts)
+            rows = self.rows_of(geom_pos)
+            share = dict(zip(geom_pos, overlap))
+            return self.result(rows, columns, geometry, {"overlap": [share[g] for g in self.store.geom_index[rows]]})
+        return self.cache.get(key, compute).copy()
+
+    #tracts containing (or touching) the point x, y
+    def point(self, x, y, columns=None, geometry=False):
+        key = ("point", float(x), float(y), tuple(columns or ()), geometry)
+        return self.cache.get(key, lambda: self.result(
+            self.rows_of(self.tree.query(shapely.Point(x, y), predicate="intersects")), columns, geometry)).copy()
+
+    def bbox(self, minx, miny, maxx, maxy, columns=None, geometry=False):
+        return self.polygon(shapely.box(minx, miny, maxx, maxy), columns, geometry)
+
+
+#JSON-safe records of a result frame. the store keeps shares as float32; they are served as the
+#shortest decimal that reads back as the same float32 (-0.02, not -0.019999999552965164)
+def records(frame):
+    frame = frame.copy()
+    for name in frame.columns:
+        if frame[name].dtype == np.float32:
+            frame[name] = [float(str(v)) for v in frame[name].to_numpy()]
+    frame = frame.astype(object).where(pd.notna(frame), None)
+    return frame.to_dict(orient="records")
+
+
+def serve(query, host="127.0.0.1", port=8000):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def respond(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def handle_query(self, body=None):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            columns = params.get("column")
+            number = lambda name: float(params[name][0])
+            try:
+                if url.path == "/neighborhood":
+                    frame = query.neighborhood(params.get("name", []), columns,
+                                               column=params.get("by", ["Neighborhood"])[0])
+                elif url.path == "/point":
+                    frame = query.point(number("x"), number("y"), columns)
+                elif url.path == "/bbox":
+                    frame = query.bbox(number("minx"), number("miny"), number("maxx"), number("maxy"), columns)
+                elif url.path == "/polygon" and body is not None:
+                    frame = query.polygon(shapely.from_geojson(body), columns)
+                else:
+                    return self.respond(404, {"error": f"unknown query {url.path}"})
+            except (KeyError, ValueError, shapely.errors.GEOSException) as e:
+                return self.respond(400, {"error": str(e)})
+            self.respond(200, records(frame))
+
+        def do_GET(self):
+            self.handle_query()
+
+        def do_POST(self):
+            self.handle_query(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"serving {len(query.store)} tracts on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="answer neighborhood/polygon/point queries on a result table")
+    parser.add_argument("table", help="result table from redlining.batch (.parquet or .feather)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help=f"cached query results (default: {CACHE_SIZE})")
+    args = parser.parse_args(argv)
+
+    serve(TractQuery.open(args.table, args.cache_size), args.host, args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+#headless rendering of the report's tract maps (and the density curves of redlining/density.py and
+#the grade boxplots of redlining/stats.py)
+#the tract polygons are turned into matplotlib Paths once per layer; every panel then only needs a
+#new PathCollection over the same Paths with its own color array, instead of GeoDataFrame.plot
+#re-projecting and re-tessellating the polygons for each subplot.
+#figures are drawn on the Agg canvas (no pyplot, no notebook kernel) and can be rendered in
+#parallel worker processes
+#
+#usage: python -m redlining.render results/houston.parquet --out figures/ --format png svg
+#(.feather tables from redlining.batch --format feather are read with redlining.export)
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.colors import LinearSegmentedColormap, ListedColormap
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from matplotlib.path import Path
+
+#the report's color choices
+RACE_COLORS = {"white": "mediumslateblue", "black": "mediumseagreen", "other": "sandybrown", "mixed": "black"}
+RACE_TITLES = {"white": "White Only", "black": "Black Only", "other": "Other Only", "mixed": "Two or More Races"}
+GRADE_COLORS = {"A": "limegreen", "B": "dodgerblue", "C": "gold", "D": "red"}
+RESTRICTION_COLORS = ["red", "steelblue", "gold", "darkgrey"]
+
+
+#matplotlib Path for one (multi)polygon, all rings in one compound path so holes are left empty
+def polygon_path(geom):
+    vertices = []
+    codes = []
+    if geom is not None:
+        for part in getattr(geom, "geoms", [geom]):
+            for ring in [part.exterior, *part.interiors]:
+                coords = np.asarray(ring.coords)[:, :2]
+                ring_codes = np.full(len(coords), Path.LINETO, dtype=Path.code_type)
+                ring_codes[0] = Path.MOVETO
+                ring_codes[-1] = Path.CLOSEPOLY
+                vertices.append(coords)
+                codes.append(ring_codes)
+    if not vertices:
+        return Path(np.zeros((0, 2)))
+    return Path(np.concatenate(vertices), np.concatenate(codes))
+
+
+#the tract polygons of one table, converted to Paths once and shared by every panel.
+#crs is the table's CRS, only used for the panels' aspect ratio
+class TractLayer:
+
+    def __init__(self, geometries, crs=None):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.paths = [polygon_path(g) for g in self.geometries]
+        if crs is not None:
+            from pyproj import CRS
+            crs = CRS.from_user_input(crs)
+        self.geographic = crs is not None and crs.is_geographic
+
+    def collection(self, mask=None, **kwargs):
+        paths = self.paths if mask is None else [p for p, keep in zip(self.paths, mask) if keep]
+        return PathCollection(paths, **kwargs)
+
+    def bounds(self, mask=None):
+        return shapely.total_bounds(self.geometries if mask is None else self.geometries[mask])
+
+    #as GeoDataFrame.plot: in degrees a unit of longitude is cos(latitude) as long as one of
+    #latitude, so the map is stretched by 1/cos of its middle latitude; equal axes otherwise
+    def aspect(self, mask=None):
+        if not self.geographic:
+            return "equal"
+        _, miny, _, maxy = self.bounds(mask)
+        return 1/np.cos(np.radians((miny+maxy)/2))
+
+
+def colorbar_cmap(color):
+    return LinearSegmentedColormap.from_list("custom", ["whitesmoke", color], N=256)
+
+
+#one choropleth panel, described by a dict:
+#  column, title, and either categorical=True (+ optional colors list) for a legend,
+#  or color (whitesmoke -> color) / cmap plus vmin, vmax for a colorbar; alpha is optional
+def draw_panel(fig, ax, layer, table, panel, mask=None):
+    values = table[panel["column"]].to_numpy()
+    if mask is not None:
+        values = values[mask]
+
+    if panel.get("categorical"):
+        categories = sorted(set(values), key=str)
+        if panel.get("colors"):
+            palette = ListedColormap(panel["colors"])(np.arange(len(categories)) % len(panel["colors"]))
+        else:
+            #GeoDataFrame.plot's default for categorical columns
+            palette = matplotlib.colormaps["tab20" if len(categories) > 10 else "tab10"](np.arange(len(categories)))
+        lookup = {cat: i for i, cat in enumerate(categories)}
+        facecolors = palette[[lookup[v] for v in values]] if len(values) else "none"
+        coll = layer.collection(mask, facecolors=facecolors, edgecolors="none", alpha=panel.get("alpha"))
+        ax.legend(handles=[Patch(color=palette[i], alpha=panel.get("alpha"), label=str(cat))
+                           for i, cat in enumerate(categories)], loc="upper left")
+    else:
+        cmap = colorbar_cmap(panel["color"]) if "color" in panel else panel.get("cmap", "viridis")
+        coll = layer.collection(mask, cmap=cmap, edgecolors="none", alpha=panel.get("alpha"))
+        coll.set_array(values.astype(float))
+        coll.set_clim(panel.get("vmin"), panel.get("vmax"))
+        fig.colorbar(coll, ax=ax)
+
+    coll.set_transform(ax.transData)
+    ax.add_collection(coll, autolim=False)
+    #an empty subset (e.g. no Oak Forest tracts in another city) leaves the panel blank
+    if len(values):
+        minx, miny, maxx, maxy = layer.bounds(mask)
+        ax.set_xlim(minx, maxx)
+        ax.set_ylim(miny, maxy)
+        ax.set_aspect(layer.aspect(mask))
+    else:
+        ax.set_aspect("equal")
+    ax.set_title(panel.get("title", panel["column"]))
+
+
+#row mask for a figure's "subset" entry, e.g. {"column": "Neighborhood", "isin": ["Oak Forest East"]}
+def subset_mask(table, subset):
+    if subset is None:
+        return None
+    column = table[subset["column"]]
+    if "isin" in subset:
+        return column.isin(subset["isin"]).to_numpy()
+    return (column < subset["below"]).to_numpy()
+
+
+#draw one figure (a dict with name, panels, and optional nrows, ncols, figsize, subset) to files
+def render_figure(layer, table, figure, out_dir, formats=("png",), dpi=100):
+    nrows = figure.get("nrows", 2)
+    ncols = figure.get("ncols", 2)
+    fig = Figure(figsize=figure.get("figsize", (15, 10)))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    mask = subset_mask(table, figure.get("subset"))
+    for ax, panel in zip(axes, figure["panels"]):
+        draw_panel(fig, ax, layer, table, panel, mask)
+    for ax in axes[len(figure["panels"]):]:
+        ax.set_axis_off()
+
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f"{figure['name']}.{fmt}")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+#one panel of density curves (a frame from redlining.density.density_curves), one line per category
+def draw_density(ax, curves, column, colors=RESTRICTION_COLORS, xlim=(-0.4, 0.4)):
+    rows = curves[curves["column"] == column]
+    for i, (category, curve) in enumerate(rows.groupby("category", observed=True, sort=True)):
+        ax.plot(curve["x"].to_numpy(), curve["density"].to_numpy(), color=colors[i % len(colors)], label=str(category))
+    ax.set_xlim(*xlim)
+    ax.set_ylabel("Density")
+    ax.set_title(column)
+    ax.legend()
+
+
+#the change-by-deed-restriction density figure (cell In[184]) from precomputed curves
+def render_density_figure(curves, out_dir, name="deed_restriction_kde", formats=("png",), dpi=100,
+                          xlim=(-0.4, 0.4)):
+    os.makedirs(out_dir, exist_ok=True)
+    columns = list(curves["column"].cat.categories if hasattr(curves["column"], "cat") else pd.unique(curves["column"]))
+    ncols = 2
+    nrows = max(1, -(-len(columns)//ncols))
+    fig = Figure(figsize=(15, 5*nrows))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    for ax, column in zip(axes, columns):
+        draw_density(ax, curves, column, xlim=xlim)
+    for ax in axes[len(columns):]:
+        ax.set_axis_off()
+
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+#boxplots of one column by top grade (cell In[26]) from precomputed redlining.stats.box_stats rows
+def draw_grade_boxes(ax, boxes, column, color="grey"):
+    rows = boxes[boxes["column"] == column].sort_values("top_grade")
+    stats = [{"label": str(row.top_grade), "q1": row.q1, "med": row.med, "q3": row.q3,
+              "whislo": row.whislo, "whishi": row.whishi, "mean": row.mean, "fliers": row.fliers}
+             for row in rows.itertuples()]
+    if stats:
+        ax.bxp(stats, boxprops={"color": color}, medianprops={"color": color}, whiskerprops={"color": color},
+               capprops={"color": color}, flierprops={"markeredgecolor": color})
+    ax.set_xlabel("top_grade")
+    ax.set_title(column)
+
+
+#the top grade boxplot figure (cell In[26]), by default for the shares of the first ACS year in boxes
+def render_grade_figure(boxes, out_dir, name="top_grade_boxplot", formats=("png",), dpi=100, columns=None):
+    if columns is None:
+        year = min(int(c.rsplit("_", 1)[1]) for c in boxes["column"].unique() if c.startswith("percent_"))
+        columns = [f"percent_{group}_{year}" for group in ("white","black","other","mixed")]
+    os.makedirs(out_dir, exist_ok=True)
+    fig = Figure(figsize=(15, 15))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(2, 2, squeeze=False).ravel()
+    for ax, column in zip(axes, columns):
+        draw_grade_boxes(ax, boxes, column)
+
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+#the tract maps from the report (cells In[182], In[181], In[183], In[190], In[159]),
+#for the columns present in the table
+def report_figures(table):
+    figures = []
+    for year in (2010, 2018):
+        if f"percent_white_{year}" in table:
+            figures.append({"name": f"race_{year}", "panels": [
+                {"column": f"percent_{g}_{year}", "color": RACE_COLORS[g], "vmin": 0, "vmax": 1,
+                 "title": f"Percent {RACE_TITLES[g]} {year}"} for g in RACE_COLORS]})
+    if "U" in table:
+        figures.append({"name": "grade_fraction", "subset": {"column": "U", "below": 1}, "panels": [
+            {"column": g, "color": c, "vmin": 0, "vmax": 1, "title": f"Percent of Tract Rated {g}"}
+            for g, c in GRADE_COLORS.items()]})
+    if "restriction" in table:
+        figures.append({"name": "deed_restriction", "nrows": 1, "ncols": 1, "figsize": (15, 5), "panels": [
+            {"column": "restriction", "categorical": True, "colors": ["red", "steelblue", "gold", "darkgrey"],
+             "title": "Race-Limiting Deed Restriction"}]})
+        if table["Neighborhood"].isin(["Oak Forest East", "Oak Forest West"]).any():
+            figures.append({"name": "oak_forest", "figsize": (15, 8),
+                            "subset": {"column": "Neighborhood", "isin": ["Oak Forest East", "Oak Forest West"]},
+                            "panels": [
+                {"column": "Neighborhood", "categorical": True, "colors": ["yellow", "lightblue"], "alpha": 0.7,
+                 "title": "1. Neigborhood"},
+                {"column": "degree", "categorical": True, "title": "2. Amount of Neighborhood in Tract"},
+                {"column": "restriction", "categorical": True, "colors": ["red", "steelblue"], "alpha": 0.7,
+                 "title": "3. Race-Limiting Deed Restriction"},
+                {"column": "percent_black_2010", "title": "4. Percent Black Alone, 2010"}]})
+    return figures
+
+
+#each worker process builds the layer for its table once, then draws the figures it is given
+worker_layer = None
+worker_table = None
+
+
+def init_render_worker(table):
+    global worker_layer, worker_table
+    worker_table = table
+    worker_layer = TractLayer(table.geometry.values, table.crs)
+
+
+def render_worker(figure, out_dir, formats, dpi):
+    return render_figure(worker_layer, worker_table, figure, out_dir, formats, dpi)
+
+
+#render figures for one tract table into out_dir, in parallel when workers > 1
+def render_figures(table, figures, out_dir, formats=("png",), dpi=100, workers=1):
+    os.makedirs(out_dir, exist_ok=True)
+    if workers is None or workers <= 1:
+        layer = TractLayer(table.geometry.values, table.crs)
+        return [path for figure in figures for path in render_figure(layer, table, figure, out_dir, formats, dpi)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_render_worker, initargs=(table,)) as pool:
+        futures = [pool.submit(render_worker, figure, out_dir, formats, dpi) for figure in figures]
+        return [path for future in futures for path in future.result()]
+
+
+#a result table from redlining.batch: GeoParquet, or Arrow (.feather/.arrow, see redlining/export.py)
+def read_table(path):
+    if path.endswith((".feather", ".arrow")):
+        from redlining.export import open_results, results_geodataframe
+        return results_geodataframe(open_results(path))
+    import geopandas as gpd
+    return gpd.read_parquet(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="render the report's tract maps from a result table")
+    parser.add_argument("table", nargs="+",
+                        help="result table(s) from redlining.batch (GeoParquet, or .feather from --format feather)")
+    parser.add_argument("--out", default="figures", help="output directory (default: figures)")
+    parser.add_argument("--format", nargs="+", default=["png"], help="file formats (default: png)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count()
+    for path in args.table:
+        table = read_table(path)
+        out_dir = os.path.join(args.out, os.path.splitext(os.path.basename(path))[0])
+        for written in render_figures(table, report_figures(table), out_dir, args.format, args.dpi, workers):
+            print(written)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
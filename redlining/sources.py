@@ -0,0 +1,147 @@
+#where a city's input files come from, and reading them concurrently
+#an input location in a manifest (see redlining/batch.py) is either a local path or an object-store
+#URI "store://<bucket>/<key>". The object store is stood in for by a local directory with one folder
+#per bucket (the store root: REDLINING_STORE or --store); fetching an object copies it, and for a
+#shapefile its .shx/.dbf/.prj/.cpg parts, into a local fetch directory, and later runs reuse the copy
+#until the object changes.
+#all of a city's files (or all the cities' files) are fetched at once in a thread pool, and the
+#ACS CSVs, the HOLC shapefile and the deed table are then parsed in parallel; the tract shapefile is
+#read as soon as the race data says which tracts to keep. File reading in pandas and pyogrio/GDAL
+#mostly runs outside the GIL, so the reads overlap instead of adding up
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from redlining.census import read_b02001, race_shares_wide
+from redlining.constants import SHAPEFILE_PARTS
+from redlining.deeds import HARRIS_TRACT_PREFIX, read_deeds
+
+STORE_SCHEME = "store://"
+STORE_ROOT = os.environ.get("REDLINING_STORE")
+FETCH_DIR = os.environ.get("REDLINING_FETCH_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache", "houston_redlining", "inputs"))
+WORKERS = 8
+#manifest keys holding one input location ("acs" holds a list)
+INPUT_KEYS = ("holc","tracts","deeds","blocks")
+
+
+#local stand-in for an object store bucket layout: <root>/<bucket>/<key>
+class LocalObjectStore:
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def exists(self, bucket, key):
+        return os.path.isfile(self.path(bucket, key))
+
+    #copy an object to dest, unless dest is already an up-to-date copy. the copy goes to a temporary
+    #file of its own first, so concurrent downloads of the same object (other threads or processes)
+    #never write into each other's file
+    def download(self, bucket, key, dest):
+        src = self.path(bucket, key)
+        stat = os.stat(src)
+        if os.path.exists(dest):
+            local = os.stat(dest)
+            if local.st_size == stat.st_size and local.st_mtime_ns == stat.st_mtime_ns:
+                return dest
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copy2(src, tmp_path)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return dest
+
+
+def is_remote(location):
+    return isinstance(location, str) and location.startswith(STORE_SCHEME)
+
+
+#"store://bucket/some/key.csv" -> ("bucket", "some/key.csv")
+def split_uri(uri):
+    bucket, _, key = uri[len(STORE_SCHEME):].partition("/")
+    if not bucket or not key:
+        raise ValueError(f"expected {STORE_SCHEME}<bucket>/<key>, got {uri!r}")
+    return bucket, key
+
+
+#local path of an input location, fetching it from the store first if it is a store URI
+def fetch(location, store_root=None, fetch_dir=None):
+    if not is_remote(location):
+        return location
+    store_root = STORE_ROOT if store_root is None else store_root
+    if store_root is None:
+        raise ValueError(f"{location!r} is in the object store, but no store root is set (REDLINING_STORE or --store)")
+    store = LocalObjectStore(store_root)
+    fetch_dir = FETCH_DIR if fetch_dir is None else fetch_dir
+
+    bucket, key = split_uri(location)
+    stem, ext = os.path.splitext(key)
+    keys = [stem+e for e in SHAPEFILE_PARTS if e == ext.lower() or store.exists(bucket, stem+e)] \
+        if ext.lower() == ".shp" else [key]
+    for part in keys:
+        store.download(bucket, part, os.path.join(fetch_dir, bucket, *part.split("/")))
+    return os.path.join(fetch_dir, bucket, *key.split("/"))
+
+
+#copies of the cities with every input location replaced by a local path; the files of all the
+#cities are fetched concurrently, and a location shared by several cities (e.g. a statewide tract
+#shapefile) is fetched once
+def fetch_cities(cities, store_root=None, fetch_dir=None, workers=WORKERS):
+    cities = [dict(city) for city in cities]
+    uses = []
+    for city in cities:
+        for key in INPUT_KEYS:
+            if city.get(key):
+                uses.append((city, key, None, city[key]))
+        city["acs"] = list(city["acs"])
+        for i, location in enumerate(city["acs"]):
+            uses.append((city, "acs", i, location))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for _, _, _, location in uses:
+            if location not in futures:
+                futures[location] = pool.submit(fetch, location, store_root, fetch_dir)
+        for city, key, i, location in uses:
+            if i is None:
+                city[key] = futures[location].result()
+            else:
+                city[key][i] = futures[location].result()
+    return cities
+
+
+def fetch_city(city, store_root=None, fetch_dir=None, workers=WORKERS):
+    return fetch_cities([city], store_root, fetch_dir, workers)[0]
+
+
+#fetch a city's inputs and parse them in parallel. returns a dict with race_long (read_b02001),
+#tracts (the tracts in the race data, see redlining/tracts.py; cached as GeoParquet at the city's
+#optional "tracts_cache" path), hoods (the HOLC polygons) and deeds (read_deeds, or None)
+def read_city_inputs(city, workers=WORKERS, store_root=None, fetch_dir=None):
+    import geopandas as gpd
+    from redlining.tracts import load_tracts
+
+    city = fetch_city(city, store_root, fetch_dir, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        race = pool.submit(read_b02001, city["acs"], workers)
+        hoods = pool.submit(gpd.read_file, city["holc"])
+        deeds = pool.submit(read_deeds, city["deeds"], city.get("tract_prefix", HARRIS_TRACT_PREFIX)) \
+            if city.get("deeds") else None
+
+        #submitted after the race read, so it never waits on a task that has not started
+        def tracts_in_race_data():
+            return load_tracts(city["tracts"], geo_ids=race_shares_wide(race.result())["id"],
+                               parquet_path=city.get("tracts_cache"))
+        tracts = pool.submit(tracts_in_race_data)
+
+        return {"race_long": race.result(), "tracts": tracts.result(), "hoods": hoods.result(),
+                "deeds": deeds.result() if deeds is not None else None}
@@ -0,0 +1,209 @@
+#summary statistics of racial composition by HOLC grade (cells In[194], In[26], In[27])
+#every group share and change is averaged per grade in one pass: the (tract x weight) matrix, with
+#one column per (grouping, weighting, grade), is multiplied with the (tract x value) matrix.
+#  grouping "grade": every tract with some of its area in the grade, weighted by that fraction
+#  grouping "top_grade": every tract by the grade covering most of it (the notebook's top_grade)
+#  weighting "tracts": the fraction (grade) or 1 (top_grade) only, i.e. the plain mean over tracts
+#  weighting "area": times the tract's area (measured in the equal-area CRS), i.e. the mean over land
+#  weighting "population": times the tract's population, i.e. the share among the grade's residents
+#bootstrap confidence intervals resample the tracts and reuse the same products, so a batch of
+#replicates is one matrix product; batches of replicates can run in worker processes.
+#box_stats gives the five-number summaries of the top_grade boxplots, so figures draw them
+#(Axes.bxp) without the raw table
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from redlining.census import CHANGE_COLUMNS, RACE_GROUPS
+from redlining.constants import EQUAL_AREA_CRS, GRADES
+
+GROUPINGS = ["grade","top_grade"]
+WEIGHTINGS = ["tracts","area","population"]
+#bootstrap replicates per batch (one matrix product each); batches get their own random streams,
+#so the intervals do not depend on the number of workers
+BATCH = 100
+
+
+#the grade covering most of each tract, among the tracts with any graded area (else NaN)
+def top_grade(table, grades=GRADES):
+    fractions = table[grades].to_numpy(dtype=float)
+    top = np.where(fractions.sum(axis=1) > 0, fractions.argmax(axis=1), -1)
+    return pd.Categorical.from_codes(top, grades)
+
+
+#the share and change columns the table has, in the notebook's order
+def stat_columns(table):
+    columns = [c for c in table.columns if c.startswith("percent_") and c.rsplit("_", 1)[0][8:] in RACE_GROUPS]
+    return columns + [c for c in CHANGE_COLUMNS.values() if c in table.columns]
+
+
+#the first ACS year of a table in the notebook's layout (from its total_<year> columns)
+def first_year(table):
+    years = sorted(int(c[6:]) for c in table.columns if c.startswith("total_") and c[6:].isdigit())
+    if not years:
+        raise ValueError("the table has no total_<year> population column")
+    return years[0]
+
+
+#the population of the first ACS year, total_<year>, unless population_col is given
+def population_column(table, population_col=None):
+    if population_col is None:
+        population_col = f"total_{first_year(table)}"
+    if population_col not in table:
+        raise ValueError(f"population column {population_col!r} is not in the table")
+    return population_col
+
+
+#area of every tract in the equal-area CRS (1 for every tract if the table has no geometry, or
+#only a plain column of that name, e.g. WKB from pandas.read_parquet)
+def tract_areas(table):
+    if not hasattr(getattr(table, "geometry", None), "crs"):
+        return np.ones(len(table))
+    geometry = table.geometry
+    if geometry.crs is not None and geometry.crs != EQUAL_AREA_CRS:
+        geometry = geometry.to_crs(EQUAL_AREA_CRS)
+    return geometry.area.to_numpy()
+
+
+#(tract x weight column) matrix and the (grouping, weighting, grade) of each column.
+#population_col defaults to the first ACS year's total_<year>
+def weight_matrix(table, grades=GRADES, population_col=None):
+    population_col = population_column(table, population_col)
+    fractions = np.nan_to_num(table[grades].to_numpy(dtype=float))
+    codes = top_grade(table, grades).codes
+    top = np.zeros_like(fractions)
+    top[codes >= 0, codes[codes >= 0]] = 1
+    base = {"tracts": np.ones(len(table)),
+            "area": tract_areas(table),
+            "population": np.nan_to_num(table[population_col].to_numpy(dtype=float))}
+
+    blocks = []
+    labels = []
+    for grouping, membership in (("grade", fractions), ("top_grade", top)):
+        for weighting in WEIGHTINGS:
+            blocks.append(membership*base[weighting][:, None])
+            labels += [(grouping, weighting, g) for g in grades]
+    return np.hstack(blocks), labels
+
+
+#weighted means of every value column for every weight column, for a batch of tract counts
+#(one row per bootstrap replicate; all ones for the plain estimate). weighted/present are the
+#(tract x weight*value) products of weights with the values and with the values' presence
+def batch_means(counts, weighted, present, shape):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ((counts @ weighted)/(counts @ present)).reshape(len(counts), *shape)
+
+
+def products(weights, values):
+    present = np.isfinite(values)
+    weighted = (weights[:, :, None]*np.where(present, values, 0)[:, None, :]).reshape(len(values), -1)
+    return weighted, (weights[:, :, None]*present[:, None, :]).reshape(len(values), -1)
+
+
+#the bootstrap inputs for worker processes, set once per worker by the pool initializer
+worker_products = None
+
+
+def init_stats_worker(weighted, present):
+    global worker_products
+    worker_products = (weighted, present)
+
+
+def bootstrap_batch(seed, n_replicates, n_tracts, shape, weighted=None, present=None):
+    if weighted is None:
+        weighted, present = worker_products
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(n_tracts, np.full(n_tracts, 1/n_tracts), size=n_replicates).astype(float)
+    return batch_means(counts, weighted, present, shape)
+
+
+#replicate means, (n_boot x weight column x value column); batches run in parallel when workers > 1
+def bootstrap_means(weighted, present, shape, n_boot, seed=0, workers=1):
+    n_tracts = len(weighted)
+    sizes = [min(BATCH, n_boot-start) for start in range(0, n_boot, BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers is None or workers <= 1 or len(sizes) < 2:
+        return np.concatenate([bootstrap_batch(s, k, n_tracts, shape, weighted, present) for s, k in zip(seeds, sizes)])
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_stats_worker, initargs=(weighted, present)) as pool:
+        futures = [pool.submit(bootstrap_batch, s, k, n_tracts, shape) for s, k in zip(seeds, sizes)]
+        return np.concatenate([future.result() for future in futures])
+
+
+#mean of every share/change column by grade and by top grade, for each weighting, as a tidy table
+#(grouping, weighting, grade, column, mean, tracts). with n_boot > 0 it also has ci_low/ci_high,
+#the percentile bootstrap interval at level ci, with batches of replicates run on workers processes.
+#the population weighting uses population_col, by default the first ACS year's total_<year>
+def grade_aggregates(table, columns=None, grades=GRADES, population_col=None,
+                     n_boot=0, ci=0.95, seed=0, workers=1):
+
+    columns = stat_columns(table) if columns is None else list(columns)
+    weights, labels = weight_matrix(table, grades, population_col)
+    values = table[columns].to_numpy(dtype=float)
+    weighted, present = products(weights, values)
+    shape = (weights.shape[1], len(columns))
+
+    means = batch_means(np.ones((1, len(table))), weighted, present, shape)[0]
+    #tracts that count towards each weight column
+    n_tracts = ((weights > 0).T.astype(float) @ np.isfinite(values)).astype(np.int64).ravel()
+
+    out = pd.DataFrame({
+        "grouping": pd.Categorical(np.repeat([l[0] for l in labels], len(columns)), categories=GROUPINGS),
+        "weighting": pd.Categorical(np.repeat([l[1] for l in labels], len(columns)), categories=WEIGHTINGS),
+        "grade": pd.Categorical(np.repeat([l[2] for l in labels], len(columns)), categories=grades),
+        "column": pd.Categorical(np.tile(columns, len(labels)), categories=columns),
+        "mean": means.ravel(),
+        "tracts": n_tracts,
+    })
+    if n_boot > 0:
+        replicates = bootstrap_means(weighted, present, shape, n_boot, seed, workers)
+        low, high = np.nanquantile(replicates, [(1-ci)/2, (1+ci)/2], axis=0)
+        out["ci_low"] = low.ravel()
+        out["ci_high"] = high.ravel()
+    return out
+
+
+#five-number summaries of each column by top grade, as matplotlib's boxplot computes them
+#(quartiles, whiskers at the furthest values within 1.5 IQR); one row per (top_grade, column).
+#"fliers" holds the values outside the whiskers (a list per row) for the outlier points
+def box_stats(table, columns=None, grades=GRADES):
+    columns = stat_columns(table) if columns is None else list(columns)
+    long = pd.DataFrame(table[columns].to_numpy(dtype=float), columns=columns)
+    long["top_grade"] = top_grade(table, grades)
+    long = long.melt(id_vars="top_grade", var_name="column").dropna()
+    long["column"] = pd.Categorical(long["column"], categories=columns)
+
+    grouped = long.groupby(["top_grade","column"], observed=True)["value"]
+    boxes = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    boxes.columns = ["q1","med","q3"]
+    boxes["mean"] = grouped.mean()
+    boxes["n"] = grouped.size()
+
+    #whiskers: the most extreme values inside [q1 - 1.5 IQR, q3 + 1.5 IQR]
+    long = long.join(boxes[["q1","q3"]], on=["top_grade","column"])
+    iqr = long["q3"]-long["q1"]
+    is_inside = (long["value"] >= long["q1"]-1.5*iqr) & (long["value"] <= long["q3"]+1.5*iqr)
+    whiskers = long.loc[is_inside].groupby(["top_grade","column"], observed=True)["value"].agg(["min","max"])
+    boxes["whislo"] = whiskers["min"]
+    boxes["whishi"] = whiskers["max"]
+    fliers = long.loc[~is_inside].groupby(["top_grade","column"], observed=True)["value"].agg(lambda v: v.tolist())
+    boxes["fliers"] = fliers.reindex(boxes.index)
+    boxes["fliers"] = [f if isinstance(f, list) else [] for f in boxes["fliers"]]
+    return boxes.reset_index()
+
+
+#write a statistics table for reports (.csv) or for reading back with types (.parquet).
+#in a CSV the box_stats fliers are JSON lists
+def write_stats(stats, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith(".parquet"):
+        stats.to_parquet(path, index=False)
+    else:
+        if "fliers" in stats:
+            stats = stats.assign(fliers=stats["fliers"].map(json.dumps))
+        stats.to_csv(path, index=False)
+    return path
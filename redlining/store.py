@@ -0,0 +1,118 @@
+#compact in-memory store for the tract table
+#the notebook builds tracts_race_merged, tracts_race_redline, tracts_race_redline_filter,
+#tracts_race_deeds_merged and oak_forest as separate GeoDataFrames, each with its own copy of the
+#geometry column. The store keeps every tract's geometry once, as WKB in one shared buffer, and the
+#attributes as typed numpy columns (float32 shares, categorical codes for grades, neighborhoods and
+#restriction status). Filters return boolean masks instead of new frames, and a frame or
+#GeoDataFrame is only built for the rows and columns that are actually needed
+import numpy as np
+import pandas as pd
+
+
+class TractStore:
+
+    #wkb: bytes buffer with every distinct geometry, wkb_offsets: start of geometry i (+ the end),
+    #geom_index: geometry of each row (rows of the same tract, e.g. a tract shared by two deed
+    #neighborhoods, point to the same geometry), columns: name -> numpy array,
+    #categories: name -> category labels for the columns stored as codes
+    def __init__(self, wkb, wkb_offsets, geom_index, columns, categories=None, crs=None):
+        self.wkb = wkb
+        self.wkb_offsets = wkb_offsets
+        self.geom_index = geom_index
+        self.columns = columns
+        self.categories = categories or {}
+        self.crs = crs
+
+    #build the store from a (Geo)DataFrame. geometries are stored once per id_col value;
+    #float columns become float32 (unless listed in keep_float64), strings become categorical codes
+    @classmethod
+    def from_frame(cls, table, id_col="id", keep_float64=()):
+        import shapely
+
+        ids = pd.Categorical(table[id_col]).remove_unused_categories()
+        if (ids.codes < 0).any():
+            raise ValueError(f"{id_col} has missing values, every row needs a tract id")
+        #first row of every id, in id order
+        _, first_row = np.unique(ids.codes, return_index=True)
+
+        geoms = np.asarray(table.geometry.values, dtype=object)[first_row]
+        wkb_list = shapely.to_wkb(geoms)
+        lengths = np.fromiter((len(b) for b in wkb_list), dtype=np.int64, count=len(wkb_list))
+        wkb_offsets = np.concatenate([[0], np.cumsum(lengths)])
+        wkb = np.frombuffer(b"".join(wkb_list), dtype=np.uint8)
+
+        columns = {}
+        categories = {}
+        for name in table.columns:
+            if name == table.geometry.name:
+                continue
+            values = table[name]
+            if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object or pd.api.types.is_string_dtype(values):
+                cat = pd.Categorical(values)
+                columns[name] = cat.codes.copy()
+                categories[name] = cat.categories
+            elif pd.api.types.is_float_dtype(values) and name not in keep_float64:
+                columns[name] = values.to_numpy(dtype=np.float32)
+            else:
+                columns[name] = values.to_numpy()
+        geom_index = ids.codes.astype(np.int32 if len(first_row) < 2**31 else np.int64)
+        return cls(wkb, wkb_offsets, geom_index, columns, categories, getattr(table, "crs", None))
+
+    def __len__(self):
+        return len(self.geom_index)
+
+    def nbytes(self):
+        return self.wkb.nbytes + self.wkb_offsets.nbytes + self.geom_index.nbytes + \
+            sum(col.nbytes for col in self.columns.values())
+
+    #the stored array of a column (codes for categorical columns), not a copy
+    def column(self, name):
+        return self.columns[name]
+
+    #a column as values: numpy view for numeric columns, labels for categorical ones
+    def values(self, name, mask=None):
+        col = self.columns[name] if mask is None else self.columns[name][mask]
+        if name in self.categories:
+            cat = pd.Categorical.from_codes(col, self.categories[name])
+            #a subset only lists its own labels (e.g. for categorical plot legends)
+            return cat if mask is None else cat.remove_unused_categories()
+        return col
+
+    #row masks, e.g. store.isin("Neighborhood", ["Oak Forest East","Oak Forest West"]) or
+    #store.where("U", np.less, 1)
+    def isin(self, name, labels):
+        if name in self.categories:
+            codes = self.categories[name].get_indexer(list(labels))
+            return np.isin(self.columns[name], codes[codes >= 0])
+        return np.isin(self.columns[name], list(labels))
+
+    def where(self, name, op, value):
+        return op(self.columns[name], value)
+
+    #geometries of the rows in mask (all rows if None), decoded from the WKB buffer
+    def geometries(self, mask=None):
+        import shapely
+
+        index = self.geom_index if mask is None else self.geom_index[mask]
+        buf = self.wkb.data if isinstance(self.wkb, np.ndarray) else memoryview(self.wkb)
+        starts = self.wkb_offsets[index]
+        ends = self.wkb_offsets[index+1]
+        return shapely.from_wkb([bytes(buf[s:e]) for s, e in zip(starts, ends)])
+
+    #every distinct geometry once, in geometry order (row i has geometry geom_index[i])
+    def distinct_geometries(self):
+        import shapely
+
+        buf = self.wkb.data if isinstance(self.wkb, np.ndarray) else memoryview(self.wkb)
+        offsets = self.wkb_offsets
+        return shapely.from_wkb([bytes(buf[offsets[i]:offsets[i+1]]) for i in range(len(offsets)-1)])
+
+    #DataFrame with just the requested columns and rows
+    def frame(self, columns=None, mask=None):
+        columns = list(self.columns) if columns is None else list(columns)
+        return pd.DataFrame({name: self.values(name, mask) for name in columns})
+
+    #GeoDataFrame with just the requested columns and rows, e.g. for plotting a subset
+    def geodataframe(self, columns=None, mask=None):
+        import geopandas as gpd
+        return gpd.GeoDataFrame(self.frame(columns, mask), geometry=self.geometries(mask), crs=self.crs)
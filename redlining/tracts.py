@@ -0,0 +1,121 @@
+#loading the census tract shapefile without reading the whole state (or country) into memory
+#features are streamed from the shapefile in Arrow batches; the bounding box is pushed down to OGR,
+#only the requested columns are read, and rows whose GEO_ID is not wanted are dropped before their
+#geometries are ever decoded
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import shapely
+from pyogrio import read_info
+from pyogrio.raw import open_arrow
+
+BATCH_SIZE = 65536
+
+
+#stream a shapefile as (attribute DataFrame, geometry array, crs) chunks. keep is an optional
+#function that takes an Arrow batch and returns a boolean mask of the rows to keep; the geometries
+#of dropped rows are never decoded
+def stream_features(path, columns, bbox=None, keep=None, batch_size=BATCH_SIZE):
+    with open_arrow(path, columns=list(columns), bbox=bbox, batch_size=batch_size, use_pyarrow=True) as source:
+        meta, reader = source
+        geom_col = meta["geometry_name"] or "wkb_geometry"
+        for batch in reader:
+            if keep is not None:
+                batch = batch.filter(keep(batch))
+            if batch.num_rows == 0:
+                continue
+            geoms = shapely.from_wkb(batch[geom_col].to_numpy(zero_copy_only=False))
+            yield batch.drop_columns([geom_col]).to_pandas(), geoms, meta["crs"]
+
+
+#read only the tracts whose GEO_ID is in geo_ids (all of them if None), optionally limited to a
+#(minx, miny, maxx, maxy) bounding box in the shapefile's CRS
+def read_tracts(path, geo_ids=None, bbox=None, columns=("GEO_ID",), id_col="GEO_ID", batch_size=BATCH_SIZE):
+
+    columns = list(columns)
+    if id_col not in columns:
+        columns.insert(0, id_col)
+    keep = None
+    if geo_ids is not None:
+        wanted = pa.array(pd.unique(np.asarray(geo_ids, dtype=str)))
+        keep = lambda batch: pc.is_in(batch[id_col], value_set=wanted)
+
+    chunks = []
+    geoms = []
+    crs = read_info(path)["crs"]
+    for attrs, chunk_geoms, crs in stream_features(path, columns, bbox, keep, batch_size):
+        chunks.append(attrs)
+        geoms.append(chunk_geoms)
+
+    if chunks:
+        attrs = pd.concat(chunks, ignore_index=True)
+        geometry = np.concatenate(geoms)
+    else:
+        attrs = pd.DataFrame({col: pd.Series(dtype=object) for col in columns})
+        geometry = np.array([], dtype=object)
+    return gpd.GeoDataFrame(attrs, geometry=geometry, crs=crs)
+
+
+#what a saved subset was read with (sorted ids or None for all, columns, bbox), kept next to it
+def subset_key(geo_ids, bbox, columns):
+    ids = None if geo_ids is None else sorted(pd.unique(np.asarray(geo_ids, dtype=str)).tolist())
+    return {"geo_ids": ids, "columns": list(columns), "bbox": None if bbox is None else [float(v) for v in bbox]}
+
+
+#True if a subset saved with key `saved` holds every tract and column asked for by `key`, and
+#the parquet file is still the one the key was written for
+def covers(saved, key, parquet_path):
+    stat = os.stat(parquet_path)
+    if saved.get("parquet") != [stat.st_size, stat.st_mtime_ns]:
+        return False
+    if saved["bbox"] != key["bbox"] or not set(key["columns"]) <= set(saved["columns"]):
+        return False
+    if saved["geo_ids"] is None:
+        return True
+    return key["geo_ids"] is not None and set(key["geo_ids"]) <= set(saved["geo_ids"])
+
+
+#same as read_tracts, but the filtered subset is saved as GeoParquet the first time and read
+#from there on later runs. the ids, columns and bbox it was read with are saved next to it
+#(<parquet_path>.json); it is rebuilt when the shapefile is newer or when it does not hold
+#everything asked for (e.g. an added ACS vintage brings new tracts)
+def load_tracts(path, geo_ids=None, bbox=None, columns=("GEO_ID",), parquet_path=None, id_col="GEO_ID"):
+
+    columns = list(columns)
+    if id_col not in columns:
+        columns.insert(0, id_col)
+    key = subset_key(geo_ids, bbox, columns)
+    key_path = None if parquet_path is None else parquet_path + ".json"
+    if parquet_path is not None and os.path.exists(parquet_path) and os.path.exists(key_path) \
+            and os.path.getmtime(parquet_path) >= os.path.getmtime(path):
+        with open(key_path) as f:
+            saved = json.load(f)
+        if covers(saved, key, parquet_path):
+            tracts = gpd.read_parquet(parquet_path, columns=columns+["geometry"])
+            #the parquet file may hold a larger subset than asked for this time
+            if geo_ids is not None:
+                tracts = tracts.loc[tracts[id_col].isin(key["geo_ids"])].reset_index(drop=True)
+            return tracts
+
+    tracts = read_tracts(path, geo_ids, bbox, columns, id_col)
+    if parquet_path is not None:
+        #both files go through a temporary file of this process first, the parquet before its key.
+        #the key records the size and mtime of the parquet file it describes, so a key left next to
+        #another subset (a crash, or another process sharing the path) is not trusted
+        os.makedirs(os.path.dirname(os.path.abspath(parquet_path)), exist_ok=True)
+        tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+        tracts.to_parquet(tmp_path, index=False)
+        #(taken before the rename, which keeps them, so it is this process's file the key describes)
+        stat = os.stat(tmp_path)
+        key["parquet"] = [stat.st_size, stat.st_mtime_ns]
+        os.replace(tmp_path, parquet_path)
+        tmp_path = f"{key_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(key, f)
+        os.replace(tmp_path, key_path)
+    return tracts